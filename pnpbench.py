@@ -0,0 +1,234 @@
+"""PNP stitcher benchmark.
+
+Generate synthetic decks of PNG files and time the stitching of them across
+the output formats and cutline styles.
+
+Usage:
+    pnpbench.py [options]
+
+Options:
+    -o FILENAME --output=FILENAME       Name of the JSON file to record the
+                                        results to.
+    -c FILENAME --compare=FILENAME      Name of a JSON baseline to compare the
+                                        results against.
+    -n N --count=N                      Number of cards in a deck, a comma
+                                        separated list benchmarks each of them
+                                        [default: 54].
+    -s SIZE --size=SIZE                 Card size in pixels as WIDTHxHEIGHT,
+                                        a comma separated list benchmarks each
+                                        of them [default: 750x1050].
+    -d RATIO --duplicates=RATIO         Ratio of cards that are copies of
+                                        another card, a comma separated list
+                                        benchmarks each of them [default: 0].
+    --dpi=DPI                           DPI of the cards, a comma separated
+                                        list benchmarks each of them
+                                        [default: 300].
+    -w DIR --work-dir=DIR               Directory to generate the decks and
+                                        outputs in, defaults to a temporary
+                                        directory.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from docopt import docopt
+from voluptuous import (
+    All,
+    Any,
+    Coerce,
+    Optional,
+    Range,
+    Schema)
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import os.path
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+
+def _list_of(validator):
+    return lambda value: [validator(item) for item in value.split(',')]
+
+
+def _card_size(value):
+    width, height = value.lower().split('x')
+    return (int(width), int(height))
+
+
+__OPT_SCHEMA = Schema({
+    Optional('--output'): Any(None, str),
+    Optional('--compare'): Any(None, str),
+    '--count': _list_of(All(Coerce(int), Range(min=1))),
+    '--size': _list_of(_card_size),
+    '--duplicates': _list_of(All(Coerce(float), Range(min=0, max=1))),
+    '--dpi': _list_of(All(Coerce(int), Range(min=1))),
+    Optional('--work-dir'): Any(None, str),
+})
+__CASE_SET = [
+    'catalog',
+    'cutline',
+    'pdf-cutthrough',
+    'pdf-inset',
+    'svg-cutthrough',
+    'svg-inset',
+]
+
+
+def __generate_deck(deck_dir, count, size, duplicates):
+    """
+    Generate a deck of random PNG files.
+
+    :returns: The filenames of the deck.
+    :rtype: list
+    """
+    from PIL import Image
+
+    os.makedirs(deck_dir, exist_ok=True)
+    rng = random.Random(count)
+    unique_count = max(int(round(count * (1 - duplicates))), 1)
+    filename_set = []
+    for index in range(count):
+        filename = os.path.join(deck_dir, 'card{:05d}.png'.format(index))
+        if index < unique_count:
+            # Noise doesn't compress, which makes for the worst case of
+            # card art
+            image = Image.frombytes(
+                'RGB', size, os.urandom(size[0] * size[1] * 3))
+            image.save(filename)
+        else:
+            shutil.copyfile(
+                filename_set[rng.randrange(unique_count)], filename)
+        filename_set.append(filename)
+
+    return filename_set
+
+
+def __run_case(case, filename_set, dpi, output_dir):
+    """
+    Run a benchmark case, to be run in a process of its own.
+
+    :returns: The wall time in seconds, the peak RSS in bytes and the output
+        size in bytes.
+    :rtype: tuple
+    """
+    from pnpstitcher.config import CONFIG_SCHEMA, DEFAULT_CONFIG
+    from pnpstitcher.cutline import CutlineGenerator
+    from pnpstitcher.image import ImageCatalog
+    from pnpstitcher.output import get_generator
+
+    file_format, _, style = case.partition('-')
+    raw_config = {
+        section: dict(value) for section, value in DEFAULT_CONFIG.items()}
+    raw_config['page']['dpi'] = str(dpi)
+    raw_config['cutline']['style'] = style or 'cutthrough'
+    config = CONFIG_SCHEMA(raw_config)
+    output_fn = os.path.join(output_dir, '{}.{}'.format(case, file_format))
+
+    start = time.perf_counter()
+    image_catalog = ImageCatalog(filename_set)
+    if case != 'catalog':
+        cutline_generator = CutlineGenerator(
+            config['page'], config['cutline'])
+        cutline_generator.generate(image_catalog)
+
+    if file_format in ('pdf', 'svg'):
+        if file_format == 'pdf':
+            page_dpi = 72
+        else:
+            page_dpi = config['svg']['page_dpi']
+        output_generator = get_generator(file_format)(
+            output_fn, cutline_generator, config['page'], page_dpi)
+        output_generator.generate(
+            image_catalog, config['cutline'], config['registration'])
+    wall_time = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    output_size = sum(
+        os.path.getsize(fn)
+        for fn in glob.glob('{}*'.format(os.path.splitext(output_fn)[0])))
+    return wall_time, peak_rss, output_size
+
+
+def __benchmark(arguments, work_dir):
+    # Every case runs in a fresh process, so that the peak RSS is its own
+    context = multiprocessing.get_context('spawn')
+    result_set = []
+    for count, size, duplicates, dpi in itertools.product(
+            arguments['--count'], arguments['--size'],
+            arguments['--duplicates'], arguments['--dpi']):
+        deck_name = 'n{}_{}x{}_d{}_dpi{}'.format(
+            count, size[0], size[1], duplicates, dpi)
+        deck_dir = os.path.join(work_dir, deck_name)
+        filename_set = __generate_deck(
+            os.path.join(deck_dir, 'cards'), count, size, duplicates)
+
+        for case in __CASE_SET:
+            output_dir = os.path.join(deck_dir, 'output')
+            os.makedirs(output_dir, exist_ok=True)
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                wall_time, peak_rss, output_size = executor.submit(
+                    __run_case, case, filename_set, dpi, output_dir).result()
+
+            result = {
+                'name': '{}/{}'.format(deck_name, case),
+                'count': count,
+                'size': list(size),
+                'duplicates': duplicates,
+                'dpi': dpi,
+                'case': case,
+                'wall_time': wall_time,
+                'peak_rss': peak_rss,
+                'output_size': output_size,
+            }
+            result_set.append(result)
+            print('{name:<50} {wall_time:>9.3f}s {peak_rss:>12,d}B '
+                  '{output_size:>14,d}B'.format(**result))
+
+    return result_set
+
+
+def __compare(result_set, baseline_fn):
+    with open(baseline_fn) as fp:
+        baseline_set = dict(
+            (result['name'], result) for result in json.load(fp)['results'])
+
+    print('')
+    print('Compared to {}:'.format(baseline_fn))
+    for result in result_set:
+        baseline = baseline_set.get(result['name'])
+        if baseline is None:
+            continue
+
+        print('{:<50} {:>+8.1%} time {:>+8.1%} RSS {:>+8.1%} size'.format(
+            result['name'],
+            result['wall_time'] / baseline['wall_time'] - 1,
+            result['peak_rss'] / baseline['peak_rss'] - 1,
+            (result['output_size'] / baseline['output_size'] - 1
+                if baseline['output_size'] else 0)))
+
+
+if __name__ == '__main__':
+    arguments = __OPT_SCHEMA(
+        docopt(__doc__, version='PNP Stitcher Benchmark 0.1'))
+
+    work_dir = arguments['--work-dir']
+    temp_work_dir = None
+    if not work_dir:
+        work_dir = temp_work_dir = tempfile.mkdtemp(prefix='pnpbench-')
+
+    try:
+        result_set = __benchmark(arguments, work_dir)
+    finally:
+        if temp_work_dir:
+            shutil.rmtree(temp_work_dir, ignore_errors=True)
+
+    if arguments['--output']:
+        with open(arguments['--output'], 'w') as fp:
+            json.dump({'results': result_set}, fp, indent=2, sort_keys=True)
+
+    if arguments['--compare']:
+        __compare(result_set, arguments['--compare'])
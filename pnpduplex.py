@@ -1,34 +1,46 @@
 """PNP page duplexer.
 
+Combine the pages of several PDF files into one, by default taking a page
+from each file in turn, e.g. a front page followed by its back page.
+
+Every file can be followed by a colon and a comma separated list of rules:
+    reverse     Take the pages of the file in reverse order, e.g. for backs
+                printed by manual duplexing.
+    flip        Rotate the pages of the file by 180 degrees, e.g. for duplex
+                printers that flip on the short edge.
+
 Usage:
-    pnpduplex.py --output=FILENAME <front_pdf> <back_pdf>
+    pnpduplex.py --output=FILENAME [--concat --pad] <pdf>...
 
 Options:
     -o FILENAME --output=FILENAME   Name of the duplexed PDF output.
-    <front_pdf>                     The PDF file containing the front pages.
-    <back_pdf>                      The PDF file containing the back pages.
+    --concat                        Take all the pages of each file in turn,
+                                    e.g. to merge outputs of separate runs.
+    --pad                           Fill in blank pages for the files that
+                                    run out of pages while interleaving.
+    <pdf>                           The PDF files, e.g. the PDF file
+                                    containing the front pages followed by the
+                                    PDF file containing the back pages.
 """
 from docopt import docopt
-from pdfrw import PdfReader, PdfWriter
+from pnpstitcher.interleave import order_pages, parse_source
+from pnpstitcher.pdfstream import PdfStreamWriter
 
 
 if __name__ == '__main__':
     arguments = docopt(__doc__, version='PNP Page Duplexer 0.1')
     output_fn = arguments['--output']
-    front_fn = arguments['<front_pdf>']
-    back_fn = arguments['<back_pdf>']
-
-    front_pdf = PdfReader(front_fn).pages
-    back_pdf = PdfReader(back_fn).pages
-
-    # Validation
-    if len(front_pdf) - len(back_pdf) != 0:
-        raise RuntimeError('The number of pages are not equal')
-
-    # Then we would start to duplex the pages and write the file
-    output_pdf = PdfWriter()
-    for x in range(len(front_pdf)):
-        output_pdf.addpage(front_pdf[x])
-        output_pdf.addpage(back_pdf[x])
-
-    output_pdf.write(output_fn)
+    source_set = [parse_source(spec) for spec in arguments['<pdf>']]
+    mode = 'concat' if arguments['--concat'] else 'interleave'
+
+    # The page counts are checked before the output is touched, then the
+    # pages are written out one source after another, each as soon as it's
+    # added, and put in order by the page tree
+    page_set = order_pages(source_set, mode, arguments['--pad'])
+    with PdfStreamWriter(output_fn) as output_pdf:
+        for page, rotate, filename, index in page_set:
+            output_pdf.add_page(page, rotate, filename, index)
+
+            # Let go of the page, so its source can be freed before the next
+            # source is read
+            page = None
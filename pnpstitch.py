@@ -1,44 +1,110 @@
 """PNP page stitcher.
 
 Usage:
-    pnpstitch.py --output=FILENAME --format=FORMAT [--config=FILENAME --rtl] <files>...
+    pnpstitch.py --output=FILENAME --format=FORMAT [options] [--back=FILENAME...] <files>...
+    pnpstitch.py --output=FILENAME --format=FORMAT --manifest=FILENAME [options] [--back=FILENAME]
 
 Options:
     -o FILENAME --output=FILENAME       Name of the output file.
-    -f FORMAT --format=FORMAT           The file format, supports either "pdf"
-                                        or "svg".
+    -f FORMAT --format=FORMAT           The file format, supports "pdf", "svg",
+                                        or "png" and "tiff" for a bitmap of
+                                        every page at the output_dpi (or the
+                                        dpi) of the page config.
     -c FILENAME --config=FILENAME       Name of the config file.
     -r --rtl                            Layout the cards from right-to-left for
                                         duplex printing.
-    <files>                             The PNG files to be stitched together.
+    -b FILENAME --back=FILENAME         The PNG file for the back of the cards,
+                                        every front page is followed by a page
+                                        of the backs for duplex printing. Give
+                                        it once for a common back, or once for
+                                        every file. With a manifest, it is
+                                        the back of the images that have none
+                                        in the manifest.
+    -m FILENAME --manifest=FILENAME     A CSV or JSON file listing the images
+                                        with the number of copies of each and
+                                        optionally their back, in place of the
+                                        files. A CSV file has a header row
+                                        naming the "path", "count" and "back"
+                                        columns, a JSON file is a list of
+                                        objects with the same keys.
+    -j N --jobs=N                       Number of worker processes to render
+                                        the pages with [default: 1].
+    --cache=DIR                         Directory to cache the rendered pages
+                                        in, only the pages whose input has
+                                        changed are rendered again. The images
+                                        downsampled to the output_dpi of the
+                                        page config are cached in it too.
+    -w --watch                          Keep running and stitch the files
+                                        again whenever the files or the config
+                                        file change.
+    --cutfile=FILENAME                  Write the cutlines of a sheet to a cut
+                                        file for a cutting machine, ordered to
+                                        keep the travel of the head short. The
+                                        format follows the extension, either
+                                        .dxf, .hpgl, .plt or .svg. With the
+                                        pack layout, a cut file is written for
+                                        every sheet.
+    --stats=FILENAME                    Write the timings and byte counts of
+                                        every phase and page to a JSON file.
+    --profile=FILENAME                  Write a cProfile dump of the run, the
+                                        pages rendered by worker processes are
+                                        not included.
+    <files>                             The PNG or JPEG files to be stitched
+                                        together, of the same dimension unless
+                                        the page config uses the pack layout.
 """
 from docopt import docopt
+from pnpstitcher.cache import PageCache
 from pnpstitcher.config import (
     ConfigParser,
     CONFIG_SCHEMA,
     DEFAULT_CONFIG)
+from pnpstitcher.cutfile import write_cutfile
+from pnpstitcher.cutpath import cut_path_set
 from pnpstitcher.image import ImageCatalog
 from pnpstitcher.cutline import CutlineGenerator
-from pnpstitcher.output import PdfGenerator, SvgGenerator
+from pnpstitcher.exception import StitcherError
+from pnpstitcher.manifest import expand_manifest, read_manifest
+from pnpstitcher.output import ParallelGenerator, get_generator
+from pnpstitcher.resample import Resampler
+from pnpstitcher.stats import Stats
 from pnpstitcher.validators import file_exists
+from pnpstitcher.watch import FileWatcher
 from voluptuous import (
+    All,
     Any,
+    Coerce,
     Optional,
+    Range,
     Schema)
+import cProfile
+import json
+import os
 import os.path
+import shutil
+import tempfile
 
 
 __OPT_SCHEMA = Schema({
     '--output': str,
-    '--format': Any('pdf', 'svg'),
+    '--format': Any('pdf', 'svg', 'png', 'tiff'),
     Optional('--config'): Any(None, file_exists),
     Optional('--rtl', default=False): bool,
+    Optional('--back', default=[]): [file_exists],
+    Optional('--manifest'): Any(None, file_exists),
+    Optional('--jobs', default=1): All(Coerce(int), Range(min=1)),
+    Optional('--cache'): Any(None, str),
+    Optional('--watch', default=False): bool,
+    Optional('--cutfile'): Any(None, str),
+    Optional('--stats'): Any(None, str),
+    Optional('--profile'): Any(None, str),
     '<files>': [file_exists],
 })
 __DEFAULT_CONFIG_PATH = [
     '$HOME/.config/pnpstitch.ini',
     './pnpstitch.ini',
 ]
+__DEFAULT_IMAGE_CACHE_PATH = '$HOME/.cache/pnpstitch/images'
 
 
 def __load_default_config():
@@ -56,40 +122,235 @@ def __load_default_config():
     return config
 
 
-if __name__ == '__main__':
-    arguments = __OPT_SCHEMA(
-        docopt(__doc__, version='PNP Page Stitcher 0.1'))
-
-    output_fn = arguments['--output']
-    config_fn = arguments['--config']
-    file_format = arguments['--format']
-    rtl = arguments['--rtl']
-    filename_set = arguments['<files>']
-
-    # Load the configuration file
+def __load_config(config_fn):
     if config_fn:
         parser = ConfigParser()
         parser.read(config_fn)
-        config = CONFIG_SCHEMA(parser.as_dict())
-    else:
-        config = __load_default_config()
+        return CONFIG_SCHEMA(parser.as_dict())
+
+    return __load_default_config()
 
-    # Setup the generators
+
+def __create_generator(
+        arguments, config, cutline_generator, page_cache=None):
+    output_fn = arguments['--output']
+    file_format = arguments['--format']
+    jobs = arguments['--jobs']
+
+    OutputGenerator = get_generator(file_format)
+    generator_options = {}
     if file_format == 'pdf':
-        OutputGenerator = PdfGenerator
         page_dpi = 72
     elif file_format == 'svg':
-        OutputGenerator = SvgGenerator
         page_dpi = config['svg']['page_dpi']
+        generator_options['reuse_images'] = config['svg']['reuse_images']
+        generator_options['image_mode'] = config['svg']['image_mode']
+    elif file_format in ('png', 'tiff'):
+        page_dpi = config['page']['output_dpi'] or config['page']['dpi']
+        # Every worker process composites with a thread pool of its own, so
+        # the processors are shared out between them
+        generator_options['threads'] = max(1, (os.cpu_count() or 1) // jobs)
+
+    if jobs > 1 or page_cache is not None:
+        return ParallelGenerator(
+            OutputGenerator, jobs, output_fn, cutline_generator,
+            config['page'], page_dpi, page_cache=page_cache,
+            **generator_options)
+    else:
+        return OutputGenerator(
+            output_fn, cutline_generator, config['page'], page_dpi,
+            **generator_options)
+
+
+def __create_resampler(arguments, config):
+    output_dpi = config['page']['output_dpi']
+    if not output_dpi or output_dpi >= config['page']['dpi']:
+        return None
+
+    if arguments['--cache']:
+        cache_dir = os.path.join(arguments['--cache'], 'images')
     else:
-        raise RuntimeError('Unsupported output file format')
+        cache_dir = os.path.expandvars(__DEFAULT_IMAGE_CACHE_PATH)
+    return Resampler(cache_dir, config['page']['dpi'], output_dpi)
+
+
+def __load_input(arguments):
+    if not arguments['--manifest']:
+        return arguments['<files>'], arguments['--back']
+
+    back_fn = arguments['--back'][0] if arguments['--back'] else None
+    return expand_manifest(read_manifest(arguments['--manifest']), back_fn)
+
+
+def __stitch(arguments, config, cutline_generator=None, page_cache=None):
+    stats = Stats()
+    mixed = config['page']['layout'] == 'pack'
+    with stats.phase('load_catalog'):
+        filename_set, back_filename_set = __load_input(arguments)
+        image_catalog = ImageCatalog(filename_set, mixed)
+
+        back_catalog = None
+        if len(back_filename_set) not in (0, 1, len(image_catalog)):
+            raise StitcherError(
+                ('Unmatched number of the back images, expected 1 or {}, '
+                 'got {}').format(
+                    len(image_catalog), len(back_filename_set)))
+        if len(back_filename_set) == 1:
+            back_filename_set = back_filename_set * len(image_catalog)
+        if back_filename_set:
+            back_catalog = ImageCatalog(back_filename_set, mixed)
+            if back_catalog.size_set != image_catalog.size_set:
+                raise StitcherError(
+                    ('Unmatched dimension of the back images, '
+                     'expected dimension: {}').format(
+                        image_catalog.image_size or 'same as the front'))
+
+    # The layout only needs to be worked out again if the image dimension has
+    # changed, or any of the image dimensions when the images are packed
+    if (cutline_generator is None or
+            cutline_generator.image_size != image_catalog.image_size or
+            (mixed and
+                cutline_generator.size_set != image_catalog.size_set)):
+        with stats.phase('generate_cutlines'):
+            cutline_generator = CutlineGenerator(
+                config['page'], config['cutline'])
+            cutline_generator.generate(image_catalog)
+
+    # Downsampling keeps the dimension of the source images, so the layout
+    # stays the same
+    resampler = __create_resampler(arguments, config)
+    if resampler is not None:
+        with stats.phase('resample'):
+            image_catalog = image_catalog.resample(resampler)
+            if back_catalog is not None:
+                back_catalog = back_catalog.resample(resampler)
+
+    output_generator = __create_generator(
+        arguments, config, cutline_generator, page_cache)
+    with stats.phase('generate'):
+        output_generator.generate(
+            image_catalog, config['cutline'], config['registration'],
+            arguments['--rtl'], back_catalog)
+
+    if arguments['--cutfile']:
+        with stats.phase('write_cutfile'):
+            __write_cutfile(arguments, config, cutline_generator)
+
+    if arguments['--stats']:
+        stats.merge(output_generator.stats.as_dict())
+        with open(arguments['--stats'], 'w') as fp:
+            json.dump(stats.as_dict(), fp, indent=2, sort_keys=True)
+
+    return cutline_generator
+
+
+def __write_cutfile(arguments, config, cutline_generator):
+    cutfile_fn = arguments['--cutfile']
+    if cutline_generator.page_plan_set is None:
+        write_cutfile(
+            cutfile_fn,
+            cut_path_set(cutline_generator.cutline_set, config['cutline']),
+            config['page'])
+        return
+
+    # Every packed page has cutlines of its own, mirrored along with the
+    # cards when they are laid out from right-to-left
+    base_fn, ext = os.path.splitext(cutfile_fn)
+    for index, page_plan in enumerate(cutline_generator.page_plan_set):
+        if arguments['--rtl']:
+            cutline_set = page_plan.cutline_set_rtl
+        else:
+            cutline_set = page_plan.cutline_set
+        write_cutfile(
+            '{}__page{:03d}{}'.format(base_fn, index + 1, ext),
+            cut_path_set(cutline_set, config['cutline']),
+            config['page'])
+
+
+def __create_watcher(arguments):
+    config_fn = arguments['--config']
+    manifest_fn = arguments['--manifest']
+    watched_set = list(arguments['<files>']) + arguments['--back']
+    if manifest_fn:
+        watched_set.append(manifest_fn)
+        for entry in read_manifest(manifest_fn):
+            watched_set.append(entry.path)
+            if entry.back:
+                watched_set.append(entry.back)
+    if config_fn:
+        watched_set.append(config_fn)
+    return FileWatcher(watched_set)
+
+
+def __watch(arguments, config):
+    config_fn = arguments['--config']
+    manifest_fn = arguments['--manifest']
+    watcher = __create_watcher(arguments)
+
+    # Without a page cache of its own, keep one around for as long as we are
+    # watching so that only the affected pages are rendered again
+    temp_cache_dir = None
+    cache_dir = arguments['--cache']
+    if not cache_dir:
+        cache_dir = temp_cache_dir = tempfile.mkdtemp(prefix='pnpstitch-')
+    page_cache = PageCache(cache_dir)
+
+    cutline_generator = None
+    reload_config = False
+    try:
+        while True:
+            # A broken config or image, or anything else that goes wrong
+            # while stitching, is reported and waited out, the next change
+            # gets another try
+            try:
+                if reload_config:
+                    config = __load_config(config_fn)
+                    cutline_generator = None
+                    reload_config = False
+                cutline_generator = __stitch(
+                    arguments, config, cutline_generator, page_cache)
+                print('Stitched {}'.format(arguments['--output']))
+            except (Exception, StitcherError) as e:
+                print('Error: {}'.format(e))
+
+            changed_set = watcher.wait()
+            if config_fn and os.path.abspath(config_fn) in changed_set:
+                reload_config = True
+            # The manifest may list other images now
+            if manifest_fn and os.path.abspath(manifest_fn) in changed_set:
+                try:
+                    new_watcher = __create_watcher(arguments)
+                    watcher.close()
+                    watcher = new_watcher
+                except (Exception, StitcherError) as e:
+                    print('Error: {}'.format(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if temp_cache_dir:
+            shutil.rmtree(temp_cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    arguments = __OPT_SCHEMA(
+        docopt(__doc__, version='PNP Page Stitcher 0.1'))
+    config = __load_config(arguments['--config'])
 
-    # Output the file
-    image_catalog = ImageCatalog(filename_set)
-    cutline_generator = CutlineGenerator(config['page'], config['cutline'])
-    cutline_generator.generate(image_catalog)
-    output_generator = OutputGenerator(
-        output_fn, cutline_generator, config['page'], page_dpi)
+    profile = None
+    if arguments['--profile']:
+        profile = cProfile.Profile()
+        profile.enable()
 
-    output_generator.generate(
-        image_catalog, config['cutline'], config['registration'], rtl)
+    try:
+        if arguments['--watch']:
+            __watch(arguments, config)
+        else:
+            page_cache = None
+            if arguments['--cache']:
+                page_cache = PageCache(arguments['--cache'])
+            __stitch(arguments, config, page_cache=page_cache)
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(arguments['--profile'])
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import os.path
+import shutil
+
+
+class LRUCache(object):
+    """
+    A simple least-recently-used cache with a bounded number of entries.
+    """
+
+    def __init__(self, max_size):
+        """
+        Constructor.
+
+        :param int max_size: The maximum number of entries to be kept.
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Get an entry from the cache and mark it as recently used.
+
+        :param key: The cache key.
+        :param default: The value to return when the key is not cached.
+        :returns: The cached value.
+        """
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            return default
+
+        self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """
+        Put an entry into the cache, evicting the least recently used entries
+        when the cache is full.
+
+        :param key: The cache key.
+        :param value: The value to be cached.
+        """
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        self._entries.clear()
+
+
+class PageCache(object):
+    """
+    A cache of rendered pages on disk, keyed by the hash of everything that
+    went into rendering the page.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Constructor.
+
+        :param str cache_dir: The directory to keep the cached pages in.
+        """
+        self.cache_dir = cache_dir
+
+    def restore(self, key, filename_set):
+        """
+        Restore the files of a cached page.
+
+        :param str key: The cache key of the page.
+        :param list filename_set: The filenames to restore the files to.
+        :returns: True if the page is restored, False if it isn't cached.
+        :rtype: bool
+        """
+        cached_filename_set = [
+            self._cached_filename(key, index)
+            for index in range(len(filename_set))]
+        if not all(os.path.isfile(fn) for fn in cached_filename_set):
+            return False
+
+        for cached_fn, filename in zip(cached_filename_set, filename_set):
+            shutil.copyfile(cached_fn, filename)
+        return True
+
+    def store(self, key, filename_set):
+        """
+        Store the files of a rendered page.
+
+        :param str key: The cache key of the page.
+        :param list filename_set: The filenames of the rendered files.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for index, filename in enumerate(filename_set):
+            cached_fn = self._cached_filename(key, index)
+            temp_fn = '{}.{}.tmp'.format(cached_fn, os.getpid())
+            shutil.copyfile(filename, temp_fn)
+            os.replace(temp_fn, cached_fn)
+
+    def _cached_filename(self, key, index):
+        """
+        Get the filename of a file of a cached page.
+
+        :param str key: The cache key of the page.
+        :param int index: The index of the file.
+        :returns: The filename.
+        :rtype: str
+        """
+        return os.path.join(self.cache_dir, '{}.{}'.format(key, index))
+
+
+def cache_key(*part_set):
+    """
+    Get a cache key out of a set of JSON-serializable values.
+
+    :param part_set: The values that make up the key.
+    :returns: The hex digest of the values.
+    :rtype: str
+    """
+    data = json.dumps(part_set, sort_keys=True, default=repr)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
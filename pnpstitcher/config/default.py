@@ -1,12 +1,15 @@
 DEFAULT_CONFIG = {
     'page': {
         'dpi': '300',
+        'output_dpi': '0',
         'width': '210mm',
         'height': '297mm',
         'margin_x': '3mm',
         'margin_y': '10mm',
         'mode': 'full',
         'registration': 'false',
+        'rotate': 'auto',
+        'layout': 'grid',
     },
     'cutline': {
         'color': '#999999',
@@ -20,6 +23,8 @@ DEFAULT_CONFIG = {
     },
     'svg': {
         'page_dpi': '96',
+        'reuse_images': 'false',
+        'image_mode': 'embed',
     },
     'registration': {
         'type': 'square',
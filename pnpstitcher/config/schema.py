@@ -4,6 +4,7 @@ from voluptuous import (
     Boolean,
     Coerce,
     Optional,
+    Range,
     Required,
     Schema,
     REMOVE_EXTRA)
@@ -12,12 +13,15 @@ from pnpstitcher.validators import inches, csscolor
 
 _PAGE_SCHEMA = Schema({
     Required('dpi', default=300): Coerce(int),
+    Optional('output_dpi', default=0): All(Coerce(int), Range(min=0)),
     Required('width', default=inches('210mm')): All(str, inches),
     Required('height', default=inches('297mm')): All(str, inches),
     Required('margin_x', default=inches('3mm')): All(str, inches),
     Required('margin_y', default=inches('3mm')): All(str, inches),
     Required('mode', default='full'): Any('full', 'cutline', 'image'),
-    Optional('registration', default=False): Boolean,
+    Optional('registration', default=False): Boolean(),
+    Optional('rotate', default='auto'): Any('auto', 'never'),
+    Optional('layout', default='grid'): Any('grid', 'pack'),
 }, extra=REMOVE_EXTRA)
 
 _CUTLINE_SCHEMA = Schema({
@@ -34,6 +38,9 @@ _CUTLINE_SCHEMA = Schema({
 
 _SVG_SCHEMA = Schema({
     Required('page_dpi', default=96): Coerce(int),
+    Optional('reuse_images', default=False): Boolean(),
+    Optional('image_mode', default='embed'): All(
+        str, Any('embed', 'link', 'copy', 'hardlink')),
 }, extra=REMOVE_EXTRA)
 
 _REGISTRATION_SCHEMA = Schema({
@@ -0,0 +1,134 @@
+from pnpstitcher.exception import StitcherError
+import os.path
+
+
+MM_PER_INCH = 25.4
+
+# HP-GL plotter units, 0.025mm each
+HPGL_UNIT_PER_INCH = 1016
+
+
+def write_cutfile(filename, path_set, page_config):
+    """
+    Write the cut paths of a sheet to a cut file, without any image.
+
+    The format is chosen by the extension of the file, either DXF (.dxf),
+    HP-GL (.hpgl or .plt) or SVG (.svg). The paths are written in the order
+    they are to be cut.
+
+    :param str filename: The filename of the cut file.
+    :param list path_set: The ordered list of cut paths, in inches.
+    :param dict page_config: The page configuration.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    try:
+        writer = _WRITER_SET[ext]
+    except KeyError:
+        raise StitcherError(
+            'Unsupported cut file format. File: {}'.format(filename))
+
+    writer(filename, path_set, page_config)
+
+
+def _write_dxf(filename, path_set, page_config):
+    """
+    Write the cut paths as an R12 DXF file in millimeters.
+
+    :param str filename: The filename of the cut file.
+    :param list path_set: The ordered list of cut paths, in inches.
+    :param dict page_config: The page configuration.
+    """
+    page_height = page_config['height']
+
+    def point_group(point, code=10):
+        # DXF has the y axis pointing up
+        return '{}\n{:.4f}\n{}\n{:.4f}\n{}\n0.0\n'.format(
+            code, point[0] * MM_PER_INCH,
+            code + 10, (page_height - point[1]) * MM_PER_INCH,
+            code + 20)
+
+    with open(filename, 'w') as fp:
+        fp.write('0\nSECTION\n2\nENTITIES\n')
+        for path in path_set:
+            if not path.closed and len(path.point_set) == 2:
+                fp.write('0\nLINE\n8\nCUT\n')
+                fp.write(point_group(path.point_set[0]))
+                fp.write(point_group(path.point_set[1], 11))
+                continue
+
+            point_set = path.point_set
+            if path.closed:
+                point_set = point_set[:-1]
+            fp.write('0\nPOLYLINE\n8\nCUT\n66\n1\n70\n{}\n'.format(
+                1 if path.closed else 0))
+            fp.write('10\n0.0\n20\n0.0\n30\n0.0\n')
+            for point in point_set:
+                fp.write('0\nVERTEX\n8\nCUT\n')
+                fp.write(point_group(point))
+            fp.write('0\nSEQEND\n8\nCUT\n')
+        fp.write('0\nENDSEC\n0\nEOF\n')
+
+
+def _write_hpgl(filename, path_set, page_config):
+    """
+    Write the cut paths as an HP-GL file.
+
+    :param str filename: The filename of the cut file.
+    :param list path_set: The ordered list of cut paths, in inches.
+    :param dict page_config: The page configuration.
+    """
+    page_height = page_config['height']
+
+    def coordinate(point):
+        # HP-GL has the y axis pointing up
+        return '{},{}'.format(
+            round(point[0] * HPGL_UNIT_PER_INCH),
+            round((page_height - point[1]) * HPGL_UNIT_PER_INCH))
+
+    with open(filename, 'w') as fp:
+        fp.write('IN;SP1;\n')
+        for path in path_set:
+            fp.write('PU{};PD{};\n'.format(
+                coordinate(path.point_set[0]),
+                ','.join(coordinate(point) for point in path.point_set[1:])))
+        fp.write('PU0,0;SP0;\n')
+
+
+def _write_svg(filename, path_set, page_config):
+    """
+    Write the cut paths as an SVG file in millimeters.
+
+    :param str filename: The filename of the cut file.
+    :param list path_set: The ordered list of cut paths, in inches.
+    :param dict page_config: The page configuration.
+    """
+    # Only needed for SVG cut files, so it's not loaded for any other run
+    from svgwrite import Drawing
+    from svgwrite.shapes import Polygon, Polyline
+
+    width = page_config['width'] * MM_PER_INCH
+    height = page_config['height'] * MM_PER_INCH
+    drawing = Drawing(
+        filename,
+        size=('{}mm'.format(width), '{}mm'.format(height)),
+        viewBox='0 0 {} {}'.format(width, height))
+
+    for path in path_set:
+        point_set = [
+            (x * MM_PER_INCH, y * MM_PER_INCH) for x, y in path.point_set]
+        if path.closed:
+            shape_class, point_set = Polygon, point_set[:-1]
+        else:
+            shape_class = Polyline
+        drawing.add(shape_class(
+            point_set, fill='none', stroke='#000000', stroke_width=0.1))
+
+    drawing.save()
+
+
+_WRITER_SET = {
+    '.dxf': _write_dxf,
+    '.hpgl': _write_hpgl,
+    '.plt': _write_hpgl,
+    '.svg': _write_svg,
+}
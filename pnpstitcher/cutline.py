@@ -1,8 +1,14 @@
 from collections import namedtuple
+from pnpstitcher.layout import LayoutPlan, PackedLayout
 
 
 CutLine = namedtuple('CutLine', ['x0', 'y0', 'x1', 'y1'])
 
+# The layout of a page, the indexes of the images on it and its cutlines for
+# both directions
+PagePlan = namedtuple(
+    'PagePlan', ['layout', 'index_set', 'cutline_set', 'cutline_set_rtl'])
+
 
 class CutlineGenerator(object):
     def __init__(self, page_config, cutline_config):
@@ -15,6 +21,10 @@ class CutlineGenerator(object):
         self._page_config = page_config
         self._cutline_config = cutline_config
 
+        self.image_size = None
+        self.size_set = None
+        self.layout = None
+        self.page_plan_set = None
         self.card_num_x = 0
         self.card_num_y = 0
         self.cut_margin_x = 0
@@ -25,42 +35,99 @@ class CutlineGenerator(object):
         """
         Generate the cutline based on the images fed.
 
+        In the pack layout, every page has a layout and cutlines of its own,
+        which are kept as the page plans instead.
+
         :param ImageCatalog image_catalog: The image catalog.
         """
-        # Get the image dimensions
-        image_dimension = image_catalog.image_size
-        self._image_width = image_dimension[0] / self._page_config['dpi']
-        self._image_height = image_dimension[1] / self._page_config['dpi']
-
-        # Get the page meta
-        card_num_x, cut_margin_x = divmod(
-            self._page_config['width'] - self._page_config['margin_x'] * 2,
-            self._image_width)
-        card_num_y, cut_margin_y = divmod(
-            self._page_config['height'] - self._page_config['margin_y'] * 2,
-            self._image_height)
-
-        self.card_num_x = int(card_num_x)
-        self.card_num_y = int(card_num_y)
-        self.cut_margin_x = cut_margin_x / 2 + self._page_config['margin_x']
-        self.cut_margin_y = cut_margin_y / 2 + self._page_config['margin_y']
-
-        # Validation
-        if self.card_num_x == 0 or self.card_num_y == 0:
-            raise RuntimeError('Image too large for the page')
+        self.image_size = image_catalog.image_size
+        self.size_set = image_catalog.size_set
+        rotate = self._page_config['rotate'] == 'auto'
+        if self._page_config['layout'] == 'pack':
+            self.layout = None
+            self.cutline_set = None
+            self.page_plan_set = []
+            for index_set, layout in PackedLayout.pack(
+                    self._page_config, self.size_set, rotate):
+                if self._cutline_config['style'] == 'inset':
+                    cutline_set = self._generate_inset(layout)
+                else:
+                    cutline_set = self._generate_packed_cutthrough(layout)
+                self.page_plan_set.append(PagePlan(
+                    layout, index_set, cutline_set,
+                    self._mirror(cutline_set)))
+            return None
+
+        # Work out the layout of the page, the cut-through lines run across
+        # the whole page so the rows can't be mixed for them
+        self.page_plan_set = None
+        self.layout = LayoutPlan.create(
+            self._page_config, self.image_size, rotate=rotate,
+            mixed=self._cutline_config['style'] == 'inset')
+        self._image_width, self._image_height = self.layout.slot_size(0)
+        self.card_num_x = self.layout.card_num_x
+        self.card_num_y = self.layout.card_num_y
+        self.cut_margin_x = self.layout.cut_margin_x
+        self.cut_margin_y = self.layout.cut_margin_y
 
         # Generate the cutline
         method = getattr(
             self, '_generate_{}'.format(self._cutline_config['style']))
-        self.cutline_set = method()
+        self.cutline_set = method(self.layout)
         return self.cutline_set
 
-    def _generate_inset(self):
+    def page_count(self, card_count):
+        """
+        Get the number of pages needed for a number of cards.
+
+        :param int card_count: The number of cards.
+        :returns: The number of pages.
+        :rtype: int
+        """
+        if self.page_plan_set is not None:
+            return len(self.page_plan_set)
+        return self.layout.page_count(card_count)
+
+    def page_plan(self, page_index, card_count):
+        """
+        Get the plan of a page.
+
+        :param int page_index: The index of the page.
+        :param int card_count: The number of cards.
+        :returns: The page plan.
+        :rtype: PagePlan
+        """
+        if self.page_plan_set is not None:
+            return self.page_plan_set[page_index]
+
+        # The grid is centered on the page, so it's the same both ways
+        start, stop = self.layout.page_range(page_index)
+        return PagePlan(
+            self.layout, range(start, min(stop, card_count)),
+            self.cutline_set, self.cutline_set)
+
+    def _mirror(self, cutline_set):
+        """
+        Mirror the cutlines for the page laid out from right-to-left.
+
+        :param list cutline_set: The list of cutlines.
+        :returns: The list of mirrored cutlines.
+        :rtype: list
+        """
+        page_width = self._page_config['width']
+        return [
+            CutLine(page_width - line.x1, line.y0, page_width - line.x0,
+                    line.y1)
+            for line in cutline_set]
+
+    def _generate_inset(self, layout):
         """
         Generate the inset style of cutlines.
 
         This style would draw the cutline around the card that we want to cut,
         which would be useful for a cutting machine.
+
+        :param LayoutPlan layout: The layout of the page.
         """
         cutline_set = []
 
@@ -68,47 +135,52 @@ class CutlineGenerator(object):
         trim_x = self._cutline_config['trim_offset_x']
         trim_y = self._cutline_config['trim_offset_y']
 
-        prev_y = self.cut_margin_y
-        for cnt_y in range(self.card_num_y):
-            prev_x = self.cut_margin_x
-
-            for cnt_x in range(self.card_num_x):
-                cutline_set.append(CutLine(
-                    # Top-left corner
-                    prev_x + trim_x,
-                    prev_y + trim_y,
-
-                    # Bottom-right corner
-                    prev_x + self._image_width - trim_x,
-                    prev_y + self._image_height - trim_y))
+        for index in range(layout.card_per_page):
+            prev_x, prev_y = layout.slot(index)
+            slot_width, slot_height = layout.slot_size(index)
+            if layout.slot_rotated[index]:
+                slot_trim_x, slot_trim_y = trim_y, trim_x
+            else:
+                slot_trim_x, slot_trim_y = trim_x, trim_y
 
-                prev_x = prev_x + self._image_width
+            cutline_set.append(CutLine(
+                # Top-left corner
+                prev_x + slot_trim_x,
+                prev_y + slot_trim_y,
 
-            prev_y = prev_y + self._image_height
+                # Bottom-right corner
+                prev_x + slot_width - slot_trim_x,
+                prev_y + slot_height - slot_trim_y))
 
         return cutline_set
 
-    def _generate_cutthrough(self):
+    def _generate_cutthrough(self, layout):
         """
         Generate the cut-through style of cutlines.
 
         This style would draw lines across the whole page so that the person
         can easily cut through the whole sheet of paper using a guillotine or
         rotary cutter.
+
+        :param LayoutPlan layout: The layout of the page.
         """
         cutline_set = []
         page_width = self._page_config['width']
         page_height = self._page_config['height']
 
-        # Generate the vertical cutlines
+        # Generate the vertical cutlines, the trims are given for the upright
+        # card so they are swapped when the whole grid is rotated
         trim_x = self._cutline_config['trim_offset_x']
         trim_y = self._cutline_config['trim_offset_y']
+        if layout.slot_rotated[0]:
+            trim_x, trim_y = trim_y, trim_x
         prev_x = self.cut_margin_x
         if not trim_x:
             # If it's a clean cut, we need to draw the left-most cut line
             cutline_set.append(CutLine(prev_x, 0, prev_x, page_height))
 
         for cnt in range(self.card_num_x):
+            prev_x = layout.slot_x[cnt]
             next_x = prev_x + self._image_width
             if trim_x:
                 left_cut = prev_x + trim_x
@@ -120,8 +192,6 @@ class CutlineGenerator(object):
                 cutline_set.append(CutLine(
                     next_x, 0, next_x, page_height))
 
-            prev_x = next_x
-
         # Generate the horizontal cutlines
         prev_y = self.cut_margin_y
         if not trim_y:
@@ -129,6 +199,7 @@ class CutlineGenerator(object):
             cutline_set.append(CutLine(0, prev_y, page_width, prev_y))
 
         for cnt in range(self.card_num_y):
+            prev_y = layout.slot_y[cnt * self.card_num_x]
             next_y = prev_y + self._image_height
             if trim_y:
                 top_cut = prev_y + trim_y
@@ -139,6 +210,43 @@ class CutlineGenerator(object):
             else:
                 cutline_set.append(CutLine(0, next_y, page_width, next_y))
 
-            prev_y = next_y
+        return cutline_set
+
+    def _generate_packed_cutthrough(self, layout):
+        """
+        Generate the cut-through style of cutlines for a packed page.
+
+        The rows are cut off across the whole page first, then every card is
+        cut off along its row, and the bottom of the cards shorter than their
+        row is cut off last, so the page can still be cut with a guillotine.
+
+        :param PackedLayout layout: The layout of the page.
+        """
+        cutline_set = []
+        page_width = self._page_config['width']
+        trim_x = self._cutline_config['trim_offset_x']
+        trim_y = self._cutline_config['trim_offset_y']
+
+        row_set = sorted(set(zip(layout.slot_y, layout.row_height)))
+        for row_y, row_height in row_set:
+            for cut_y in (row_y + trim_y, row_y + row_height - trim_y):
+                cutline_set.append(CutLine(0, cut_y, page_width, cut_y))
+
+        for index in range(layout.card_per_page):
+            prev_x, prev_y = layout.slot(index)
+            slot_width, slot_height = layout.slot_size(index)
+            if layout.slot_rotated[index]:
+                slot_trim_x, slot_trim_y = trim_y, trim_x
+            else:
+                slot_trim_x, slot_trim_y = trim_x, trim_y
+
+            row_bottom = prev_y + layout.row_height[index]
+            for cut_x in (
+                    prev_x + slot_trim_x, prev_x + slot_width - slot_trim_x):
+                cutline_set.append(CutLine(cut_x, prev_y, cut_x, row_bottom))
+            if slot_height < layout.row_height[index]:
+                cut_y = prev_y + slot_height - slot_trim_y
+                cutline_set.append(CutLine(
+                    prev_x, cut_y, prev_x + slot_width, cut_y))
 
         return cutline_set
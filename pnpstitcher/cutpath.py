@@ -0,0 +1,191 @@
+from collections import namedtuple
+from pnpstitcher.cutline import CutLine
+import math
+
+
+CutPath = namedtuple('CutPath', ['point_set', 'closed'])
+
+# The number of segments a quarter circle is drawn with
+ARC_SEGMENTS = 8
+
+
+def arc_points(center_x, center_y, radius, start_angle, end_angle):
+    """
+    Get the points of an arc, clockwise on the page.
+
+    :param float center_x: The x position of the center.
+    :param float center_y: The y position of the center.
+    :param float radius: The radius.
+    :param float start_angle: The start angle in degrees.
+    :param float end_angle: The end angle in degrees.
+    :returns: The points of the arc.
+    :rtype: list
+    """
+    segment_count = max(
+        1, round(ARC_SEGMENTS * (end_angle - start_angle) / 90))
+    point_set = []
+    for index in range(segment_count + 1):
+        angle = math.radians(
+            start_angle + (end_angle - start_angle) * index / segment_count)
+        point_set.append((
+            center_x + radius * math.cos(angle),
+            center_y + radius * math.sin(angle)))
+    return point_set
+
+
+def rectangle_points(line, round_corner=0):
+    """
+    Get the points of the outline of a rectangle, ending where it starts.
+
+    :param CutLine line: The top-left and bottom-right corners.
+    :param float round_corner: The radius length of the round corner.
+    :returns: The points of the outline.
+    :rtype: list
+    """
+    if round_corner:
+        point_set = (
+            arc_points(
+                line.x0 + round_corner, line.y0 + round_corner,
+                round_corner, 180, 270) +
+            arc_points(
+                line.x1 - round_corner, line.y0 + round_corner,
+                round_corner, -90, 0) +
+            arc_points(
+                line.x1 - round_corner, line.y1 - round_corner,
+                round_corner, 0, 90) +
+            arc_points(
+                line.x0 + round_corner, line.y1 - round_corner,
+                round_corner, 90, 180))
+    else:
+        point_set = [
+            (line.x0, line.y0), (line.x1, line.y0),
+            (line.x1, line.y1), (line.x0, line.y1)]
+
+    point_set.append(point_set[0])
+    return point_set
+
+
+def merge_collinear(cutline_set):
+    """
+    Merge the horizontal and vertical cutlines that overlap or touch along
+    the same line, so each of them is cut in one stroke.
+
+    :param list cutline_set: The list of cutlines.
+    :returns: The list of merged cutlines.
+    :rtype: list
+    """
+    span_set = {}
+    merged_set = []
+    for line in cutline_set:
+        if line.x0 == line.x1:
+            key = ('vertical', line.x0)
+            span = tuple(sorted((line.y0, line.y1)))
+        elif line.y0 == line.y1:
+            key = ('horizontal', line.y0)
+            span = tuple(sorted((line.x0, line.x1)))
+        else:
+            merged_set.append(line)
+            continue
+        span_set.setdefault(key, []).append(span)
+
+    for (axis, position), spans in span_set.items():
+        spans.sort()
+        start, end = spans[0]
+        for next_start, next_end in spans[1:]:
+            if next_start <= end:
+                end = max(end, next_end)
+                continue
+
+            merged_set.append(_axis_line(axis, position, start, end))
+            start, end = next_start, next_end
+        merged_set.append(_axis_line(axis, position, start, end))
+
+    return merged_set
+
+
+def _axis_line(axis, position, start, end):
+    """
+    Get a horizontal or vertical cutline.
+
+    :param str axis: Either "horizontal" or "vertical".
+    :param float position: The position of the line across the axis.
+    :param float start: The start of the line along the axis.
+    :param float end: The end of the line along the axis.
+    :returns: The cutline.
+    :rtype: CutLine
+    """
+    if axis == 'vertical':
+        return CutLine(position, start, position, end)
+    return CutLine(start, position, end, position)
+
+
+def order_paths(path_set, origin=(0, 0)):
+    """
+    Order the paths to keep the travel of the cutting head short.
+
+    Starting from the origin, the path that starts nearest to the head is
+    cut next. Open paths are cut in whichever direction starts nearer, which
+    gives alternating strokes over a row of lines, and closed paths start at
+    their nearest point.
+
+    :param list path_set: The list of cut paths.
+    :param tuple origin: The starting position of the cutting head.
+    :returns: The ordered list of cut paths.
+    :rtype: list
+    """
+    remaining_set = list(path_set)
+    ordered_set = []
+    position = origin
+    while remaining_set:
+        best = None
+        for index, path in enumerate(remaining_set):
+            if path.closed:
+                candidate_set = enumerate(path.point_set[:-1])
+            else:
+                candidate_set = (
+                    (0, path.point_set[0]), (-1, path.point_set[-1]))
+
+            for start, point in candidate_set:
+                distance = math.hypot(
+                    point[0] - position[0], point[1] - position[1])
+                if best is None or distance < best[0]:
+                    best = (distance, index, start)
+
+        distance, index, start = best
+        path = remaining_set.pop(index)
+        if path.closed:
+            point_set = path.point_set[:-1]
+            point_set = point_set[start:] + point_set[:start]
+            point_set.append(point_set[0])
+        elif start == -1:
+            point_set = path.point_set[::-1]
+        else:
+            point_set = list(path.point_set)
+
+        ordered_set.append(CutPath(point_set, path.closed))
+        position = point_set[-1]
+
+    return ordered_set
+
+
+def cut_path_set(cutline_set, cutline_config):
+    """
+    Get the paths a cutting machine follows to cut the cutlines of a sheet.
+
+    :param list cutline_set: The list of cutlines.
+    :param dict cutline_config: The cutline configuration.
+    :returns: The ordered list of cut paths, in inches.
+    :rtype: list
+    """
+    if cutline_config['style'] == 'inset':
+        path_set = [
+            CutPath(
+                rectangle_points(line, cutline_config['round_corner']),
+                True)
+            for line in cutline_set]
+    else:
+        path_set = [
+            CutPath([(line.x0, line.y0), (line.x1, line.y1)], False)
+            for line in merge_collinear(cutline_set)]
+
+    return order_paths(path_set)
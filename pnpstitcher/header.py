@@ -0,0 +1,92 @@
+from collections import namedtuple
+from pnpstitcher.exception import StitcherError
+import struct
+
+
+ImageHeader = namedtuple('ImageHeader', ['format', 'width', 'height'])
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_JPEG_SIGNATURE = b'\xff\xd8'
+
+# SOF0 to SOF15, except DHT (0xC4), JPG (0xC8) and DAC (0xCC)
+_JPEG_SOF_MARKERS = frozenset(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+
+# Markers that are not followed by a segment length
+_JPEG_STANDALONE_MARKERS = frozenset(range(0xd0, 0xda)) | {0x01}
+
+
+def read_image_header(filename):
+    """
+    Read the format and dimension of an image.
+
+    PNG and JPEG files are parsed directly from the IHDR chunk and the SOF
+    marker respectively, without decoding anything else. Other formats fall
+    back to PIL.
+
+    :param str filename: The filename of the image.
+    :returns: The image header.
+    :rtype: ImageHeader
+    """
+    with open(filename, 'rb') as fp:
+        signature = fp.read(len(_PNG_SIGNATURE))
+        fp.seek(0)
+        try:
+            if signature == _PNG_SIGNATURE:
+                return _read_png_header(fp)
+            elif signature.startswith(_JPEG_SIGNATURE):
+                return _read_jpeg_header(fp)
+        except (struct.error, ValueError):
+            raise StitcherError(
+                'Unable to read the image header. File: {}'.format(filename))
+
+    from PIL import Image
+
+    with Image.open(filename) as image:
+        return ImageHeader(image.format, *image.size)
+
+
+def _read_png_header(fp):
+    """
+    Read the header of a PNG file.
+
+    :param file fp: The file object, positioned at the start of the file.
+    :returns: The image header.
+    :rtype: ImageHeader
+    """
+    data = fp.read(24)
+    if data[12:16] != b'IHDR':
+        raise ValueError('Missing IHDR chunk')
+
+    width, height = struct.unpack('>II', data[16:24])
+    return ImageHeader('PNG', width, height)
+
+
+def _read_jpeg_header(fp):
+    """
+    Read the header of a JPEG file.
+
+    :param file fp: The file object, positioned at the start of the file.
+    :returns: The image header.
+    :rtype: ImageHeader
+    """
+    fp.seek(len(_JPEG_SIGNATURE))
+    while True:
+        # Seek to the next marker, skipping any fill bytes
+        byte = fp.read(1)
+        while byte and byte != b'\xff':
+            byte = fp.read(1)
+        while byte == b'\xff':
+            byte = fp.read(1)
+        if not byte:
+            raise ValueError('Missing SOF marker')
+
+        marker = ord(byte)
+        if marker in _JPEG_STANDALONE_MARKERS:
+            continue
+
+        length, = struct.unpack('>H', fp.read(2))
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>xHH', fp.read(5))
+            return ImageHeader('JPEG', width, height)
+
+        fp.seek(length - 2, 1)
@@ -1,25 +1,212 @@
-from PIL import Image
 from pnpstitcher.exception import StitcherError
+from pnpstitcher.header import read_image_header
+import copy
+import hashlib
+import os
+
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+_content_hash_set = {}
+
+
+def content_hash(filename):
+    """
+    Get the hash of the content of a file.
+
+    The hash is memoized against the file size and modification time, so a
+    file is only read again once it has changed.
+
+    :param str filename: The filename.
+    :returns: The hex digest of the file content.
+    :rtype: str
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    digest = _content_hash_set.get(key)
+    if digest is None:
+        hasher = hashlib.sha1()
+        with open(filename, 'rb') as fp:
+            for block in iter(lambda: fp.read(_HASH_BLOCK_SIZE), b''):
+                hasher.update(block)
+
+        digest = hasher.hexdigest()
+        _content_hash_set[key] = digest
+
+    return digest
+
+
+def canonical_filename_set(filename_set):
+    """
+    Map every file to the first file with the same content.
+
+    Only the files of the same size could have the same content, so only
+    those are hashed, and the hash itself is memoized against the size and
+    modification time of the file.
+
+    :param list filename_set: The filenames.
+    :returns: The canonical filenames in the same order.
+    :rtype: list
+    """
+    size_group_set = {}
+    for filename in dict.fromkeys(filename_set):
+        size_group_set.setdefault(
+            os.path.getsize(filename), []).append(filename)
+
+    canonical_set = {}
+    for group in size_group_set.values():
+        if len(group) == 1:
+            canonical_set[group[0]] = group[0]
+            continue
+
+        hash_set = {}
+        for filename in group:
+            canonical_set[filename] = hash_set.setdefault(
+                content_hash(filename), filename)
+
+    return [canonical_set[filename] for filename in filename_set]
 
 
 class ImageCatalog(object):
-    def __init__(self, filename_set):
-        self.image_set = [
-            Image.open(filename)
-            for filename in filename_set]
-        self.image_size = self.get_common_dimension()
+    def __init__(self, filename_set, mixed=False):
+        """
+        Constructor.
+
+        Identical files are replaced by one canonical file, so the image is
+        shared by every card showing it even when the filenames differ. Only
+        the image headers are read here, once for every distinct file, the
+        images are opened one at a time when the catalog is iterated. The
+        filenames as given are kept for reporting errors.
+
+        :param list filename_set: The filenames of the images.
+        :param bool mixed: Allow images of different dimensions, in which
+            case there is no common image size.
+        """
+        self.source_filename_set = list(filename_set)
+        self.filename_set = canonical_filename_set(filename_set)
+        self.size_set = []
+        header_set = {}
+        for filename in self.filename_set:
+            header = header_set.get(filename)
+            if header is None:
+                header = header_set[filename] = read_image_header(filename)
+            self.size_set.append((header.width, header.height))
+        if mixed:
+            self.image_size = None
+        else:
+            self.image_size = self.get_common_dimension()
+
+    def __len__(self):
+        return len(self.filename_set)
+
+    def __iter__(self):
+        """
+        Iterate through the images.
+
+        Each image is closed as soon as the next one is requested, so only one
+        file is kept open at any time. The copies of an image next to each
+        other share the same image, so it is only opened and decoded once.
+        """
+        from PIL import Image
+
+        image = None
+        try:
+            for filename in self.filename_set:
+                if image is None or image.filename != filename:
+                    if image is not None:
+                        image.close()
+                    image = Image.open(filename)
+                yield image
+        finally:
+            if image is not None:
+                image.close()
+
+    def slice(self, start, stop):
+        """
+        Get a catalog containing only part of the images.
+
+        The dimension of the images is carried over without validating the
+        images again.
+
+        :param int start: The index of the first image.
+        :param int stop: The index after the last image.
+        :returns: The image catalog.
+        :rtype: ImageCatalog
+        """
+        image_catalog = copy.copy(self)
+        image_catalog.source_filename_set = (
+            self.source_filename_set[start:stop])
+        image_catalog.filename_set = self.filename_set[start:stop]
+        image_catalog.size_set = self.size_set[start:stop]
+        return image_catalog
+
+    def select(self, index_set):
+        """
+        Get a catalog containing only the images at the given indexes.
+
+        :param list index_set: The indexes of the images, in order.
+        :returns: The image catalog.
+        :rtype: ImageCatalog
+        """
+        image_catalog = copy.copy(self)
+        image_catalog.source_filename_set = [
+            self.source_filename_set[index] for index in index_set]
+        image_catalog.filename_set = [
+            self.filename_set[index] for index in index_set]
+        image_catalog.size_set = [self.size_set[index] for index in index_set]
+        return image_catalog
+
+    def resample(self, resampler):
+        """
+        Get a catalog of the images downsampled to the output resolution.
+
+        The dimension of the source images is carried over, so the images are
+        still laid out at their original size.
+
+        :param Resampler resampler: The resampler.
+        :returns: The image catalog.
+        :rtype: ImageCatalog
+        """
+        image_catalog = copy.copy(self)
+        image_catalog.filename_set = resampler.resample_set(self.filename_set)
+        return image_catalog
+
+    def page_set(self, card_per_page):
+        """
+        Split the catalog into pages.
+
+        :param int card_per_page: The number of cards on a page.
+        :returns: The list of catalogs of the images on each page.
+        :rtype: list
+        """
+        return [
+            self.slice(start, start + card_per_page)
+            for start in range(0, len(self), card_per_page)]
 
     def get_common_dimension(self):
         """
         Get the common dimension.
 
+        Every image that doesn't match the dimension of the first image is
+        reported at once.
+
+        :returns: A 2-tuple containing the image width and height.
+        :rtype: tuple
         """
-        base_size = self.image_set[0].size
-        for image in self.image_set:
-            if image.size != base_size:
-                raise StitcherError(
-                    ('Unmatched dimension. File: {},'
-                     'expected dimension: {}').format(
-                        image.fp.name, base_size))
+        base_size = None
+        unmatched_set = []
+        for filename, size in zip(self.source_filename_set, self.size_set):
+            if base_size is None:
+                base_size = size
+            elif size != base_size:
+                unmatched_set.append((filename, size))
+
+        if unmatched_set:
+            raise StitcherError(
+                ('Unmatched dimension, expected dimension: {}. '
+                 'Files: {}').format(
+                    base_size,
+                    ', '.join(
+                        '{} {}'.format(filename, size)
+                        for filename, size in unmatched_set)))
 
         return base_size
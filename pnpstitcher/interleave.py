@@ -0,0 +1,149 @@
+from collections import namedtuple
+from pdfrw import PdfReader
+from pdfrw.objects import PdfArray, PdfDict, PdfName
+from pnpstitcher.exception import StitcherError
+import gc
+
+
+PageSource = namedtuple('PageSource', ['filename', 'reverse', 'rotate'])
+
+# The reorder rules that can be applied to a source
+RULE_SET = ('reverse', 'flip')
+
+
+def parse_source(spec):
+    """
+    Parse a page source specification.
+
+    A specification is the filename of a PDF file, optionally followed by a
+    colon and a comma separated list of rules: "reverse" to take the pages in
+    reverse order, and "flip" to rotate the pages by 180 degrees for duplex
+    printing that flips on the short edge.
+
+    :param str spec: The page source specification.
+    :returns: The page source.
+    :rtype: PageSource
+    """
+    filename, _, rules = spec.rpartition(':')
+    rule_set = rules.split(',')
+    if not filename or not all(rule in RULE_SET for rule in rule_set):
+        # Not a list of rules, so the colon is part of the filename
+        filename = spec
+        rule_set = []
+
+    return PageSource(
+        filename,
+        'reverse' in rule_set,
+        180 if 'flip' in rule_set else 0)
+
+
+def order_pages(source_set, mode='interleave', pad=False):
+    """
+    Order the pages of a set of page sources.
+
+    The page counts of the sources are checked right away, the pages are
+    only handed out when the returned generator is iterated. The pages are
+    handed out one source after another, each with its position in the
+    output document, so only one source has to be held in memory at a time.
+
+    :param list source_set: The page sources.
+    :param str mode: Either "interleave" to take a page from each source in
+        turn, or "concat" to take all the pages of each source in turn.
+    :param bool pad: Pad the sources that run out of pages with blank pages
+        when interleaving, rather than requiring the same number of pages.
+    :returns: A generator of 4-tuple containing the page, the degrees it
+        should be rotated by, the filename it's read from (None for a blank
+        page) and the index of the page in the output document.
+    """
+    page_count_set = [_page_count(source.filename) for source in source_set]
+
+    if mode == 'concat':
+        offset_set = [
+            sum(page_count_set[:index]) for index in range(len(source_set))]
+        return _placed_pages(
+            source_set, 0,
+            lambda source_index, page_index: (
+                offset_set[source_index] + page_index))
+
+    page_count = max(page_count_set)
+    if not pad and any(count != page_count for count in page_count_set):
+        raise StitcherError('The number of pages are not equal')
+
+    return _placed_pages(
+        source_set, page_count,
+        lambda source_index, page_index: (
+            page_index * len(source_set) + source_index))
+
+
+def _page_count(filename):
+    """
+    Count the pages of a PDF file, releasing its reader right away.
+
+    :param str filename: The filename of the PDF file.
+    :returns: The number of pages.
+    :rtype: int
+    """
+    page_count = len(PdfReader(filename).pages)
+
+    # The parsed objects refer back to their reader, collect the cycles so
+    # the reader is freed before the next file is read
+    gc.collect()
+    return page_count
+
+
+def _placed_pages(source_set, page_count, position):
+    """
+    Hand out the pages of the sources one source after another.
+
+    The reader of a source is released once its pages are handed out, before
+    the next source is read.
+
+    :param list source_set: The page sources.
+    :param int page_count: The number of pages to pad every source to with
+        blank pages.
+    :param function position: Get the index of a page in the output document
+        from the index of its source and its index in the source.
+    :returns: A generator of 4-tuple as order_pages.
+    """
+    for source_index, source in enumerate(source_set):
+        pages = PdfReader(source.filename).pages
+        if source.reverse:
+            pages = pages[::-1]
+
+        for page_index, page in enumerate(pages):
+            yield (
+                page, source.rotate, source.filename,
+                position(source_index, page_index))
+
+        for page_index in range(len(pages), page_count):
+            yield (
+                blank_page(pages[0] if pages else None), 0, None,
+                position(source_index, page_index))
+
+        # Free the reader before the next source is read, as _page_count
+        pages = page = None
+        gc.collect()
+
+
+def blank_page(template=None):
+    """
+    Create a blank page.
+
+    :param PdfDict template: The page to take the page size from, defaults to
+        A4 when there isn't any.
+    :returns: The blank page.
+    :rtype: PdfDict
+    """
+    media_box = None
+    node = template
+    while media_box is None and node is not None:
+        media_box = node.get(PdfName.MediaBox)
+        node = node.get(PdfName.Parent)
+    if media_box is None:
+        media_box = PdfArray([0, 0, 595, 842])
+
+    page = PdfDict()
+    page[PdfName.Type] = PdfName.Page
+    page[PdfName.MediaBox] = media_box
+    page[PdfName.Resources] = PdfDict()
+    return page
@@ -0,0 +1,333 @@
+from array import array
+from collections import namedtuple
+from pnpstitcher.exception import StitcherError
+import math
+
+
+class _SlotLookup(object):
+    """
+    The lookups of the slots of a page, shared by the layouts.
+    """
+    __slots__ = ()
+
+    @property
+    def card_per_page(self):
+        """
+        The number of cards on a page.
+        """
+        return len(self.slot_x)
+
+    def slot(self, index, rtl=False):
+        """
+        Get the position of a slot.
+
+        :param int index: The index of the slot on the page.
+        :param bool rtl: Layout the images from right-to-left.
+        :returns: A 2-tuple containing the x and y position in inches.
+        :rtype: tuple
+        """
+        if rtl:
+            return self.slot_x_rtl[index], self.slot_y[index]
+        return self.slot_x[index], self.slot_y[index]
+
+    def slot_size(self, index):
+        """
+        Get the size a slot takes up on the page.
+
+        :param int index: The index of the slot on the page.
+        :returns: A 2-tuple containing the width and height in inches.
+        :rtype: tuple
+        """
+        width, height = self.image_dimension(index)
+        if self.slot_rotated[index]:
+            return height, width
+        return width, height
+
+    def slot_rotation(self, index, rtl=False):
+        """
+        Get the rotation of the image in a slot.
+
+        A rotated image is turned clockwise, or counter-clockwise when laid
+        out from right-to-left so the backs of duplex pages line up with
+        their fronts.
+
+        :param int index: The index of the slot on the page.
+        :param bool rtl: Layout the images from right-to-left.
+        :returns: The clockwise rotation in degrees, either 0, 90 or 270.
+        :rtype: int
+        """
+        if not self.slot_rotated[index]:
+            return 0
+        return 270 if rtl else 90
+
+
+class LayoutPlan(_SlotLookup, namedtuple('LayoutPlan', [
+        'image_size', 'image_width', 'image_height', 'card_num_x',
+        'card_num_y', 'cut_margin_x', 'cut_margin_y', 'slot_x', 'slot_x_rtl',
+        'slot_y', 'slot_rotated'])):
+    """
+    The placement of the cards on a page.
+
+    The position of every slot on the page is worked out once, both from
+    left-to-right and right-to-left, so the pages can be rendered in any
+    order by looking up the slots by index. The plan is immutable and can be
+    passed on to the worker processes as is.
+
+    A card may be turned a quarter turn to fit more cards on a page, in
+    which case its slot is marked as rotated. Every row of a page is either
+    upright or rotated, the grid (card_num_x, card_num_y and the cut margins)
+    describes the widest row when the rows are mixed.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, page_config, image_size, rotate=False, mixed=False):
+        """
+        Work out the layout of the images on a page.
+
+        :param dict page_config: The page configuration.
+        :param tuple image_size: A 2-tuple containing the image width and
+            height in pixels.
+        :param bool rotate: Try the rotated image too, keeping whichever
+            orientation fits the most cards.
+        :param bool mixed: Allow mixing upright and rotated rows on a page.
+        :returns: The layout plan.
+        :rtype: LayoutPlan
+        """
+        image_width = image_size[0] / page_config['dpi']
+        image_height = image_size[1] / page_config['dpi']
+        usable_width = page_config['width'] - page_config['margin_x'] * 2
+        usable_height = page_config['height'] - page_config['margin_y'] * 2
+
+        def cell(rotated):
+            if rotated:
+                return image_height, image_width
+            return image_width, image_height
+
+        def row_count(rotated, height):
+            return int(height // cell(rotated)[1])
+
+        def column_count(rotated):
+            return int(usable_width // cell(rotated)[0])
+
+        # Every candidate is a list of the orientation of each row, the
+        # upright grid is listed first so it wins a tie
+        candidate_set = [[False] * row_count(False, usable_height)]
+        if rotate:
+            candidate_set.append([True] * row_count(True, usable_height))
+        if rotate and mixed:
+            # Up to and including the full upright grid, with rotated rows in
+            # the strip left below it
+            for upright_count in range(
+                    1, row_count(False, usable_height) + 1):
+                rotated_count = row_count(
+                    True, usable_height - upright_count * image_height)
+                candidate_set.append(
+                    [False] * upright_count + [True] * rotated_count)
+
+        row_set = max(
+            candidate_set,
+            key=lambda row_set: sum(
+                column_count(rotated) for rotated in row_set))
+        if not sum(column_count(rotated) for rotated in row_set):
+            raise StitcherError('Image too large for the page')
+
+        # Every position is computed from its index rather than accumulated,
+        # so the slots don't drift across the page
+        slot_x = array('d')
+        slot_x_rtl = array('d')
+        slot_y = array('d')
+        slot_rotated = array('b')
+        used_height = sum(cell(rotated)[1] for rotated in row_set)
+        cut_margin_y = (
+            (usable_height - used_height) / 2 + page_config['margin_y'])
+        row_y = cut_margin_y
+        margin_x_set = []
+        for rotated in row_set:
+            cell_width, cell_height = cell(rotated)
+            card_count = column_count(rotated)
+            margin_x = (
+                (usable_width - card_count * cell_width) / 2 +
+                page_config['margin_x'])
+            margin_x_set.append((card_count, margin_x))
+            for column in range(card_count):
+                slot_x.append(margin_x + column * cell_width)
+                slot_x_rtl.append(
+                    margin_x + (card_count - 1 - column) * cell_width)
+                slot_y.append(row_y)
+                slot_rotated.append(rotated)
+            row_y = row_y + cell_height
+
+        card_num_x, cut_margin_x = max(margin_x_set, key=lambda x: x[0])
+        return cls(
+            tuple(image_size), image_width, image_height, card_num_x,
+            len(row_set), cut_margin_x, cut_margin_y, slot_x, slot_x_rtl,
+            slot_y, slot_rotated)
+
+    def page_count(self, card_count):
+        """
+        Get the number of pages needed for a number of cards.
+
+        :param int card_count: The number of cards.
+        :returns: The number of pages.
+        :rtype: int
+        """
+        return int(math.ceil(card_count / self.card_per_page))
+
+    def page_range(self, page_index):
+        """
+        Get the range of the cards on a page.
+
+        :param int page_index: The index of the page.
+        :returns: A 2-tuple containing the index of the first card and the
+            index after the last card.
+        :rtype: tuple
+        """
+        start = page_index * self.card_per_page
+        return start, start + self.card_per_page
+
+    def image_dimension(self, index):
+        """
+        Get the dimension of the image in a slot, before it is rotated.
+
+        :param int index: The index of the slot on the page.
+        :returns: A 2-tuple containing the width and height in inches.
+        :rtype: tuple
+        """
+        return self.image_width, self.image_height
+
+
+class PackedLayout(_SlotLookup, namedtuple('PackedLayout', [
+        'image_width', 'image_height', 'slot_x', 'slot_x_rtl', 'slot_y',
+        'slot_rotated', 'row_height'])):
+    """
+    The placement of cards of different sizes on a page.
+
+    The cards are packed onto shelves, rows as tall as their tallest card
+    with every card aligned to the top of its row. Unlike LayoutPlan, every
+    page has a layout of its own, and the dimension of the image is kept for
+    every slot.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def pack(cls, page_config, size_set, rotate=False):
+        """
+        Pack images of different sizes onto pages.
+
+        The images are placed from the tallest down, each on the first shelf
+        of any page it fits on, opening a new shelf or a new page only when
+        it doesn't fit anywhere else (first-fit decreasing height).
+
+        :param dict page_config: The page configuration.
+        :param list size_set: The 2-tuples containing the width and height of
+            every image in pixels.
+        :param bool rotate: Rotate an image that only fits the page rotated.
+        :returns: The list of 2-tuples containing the indexes of the images
+            on the page and the layout of the page.
+        :rtype: list
+        """
+        usable_width = page_config['width'] - page_config['margin_x'] * 2
+        usable_height = page_config['height'] - page_config['margin_y'] * 2
+
+        item_set = []
+        for index, size in enumerate(size_set):
+            width = size[0] / page_config['dpi']
+            height = size[1] / page_config['dpi']
+            rotated = False
+            if width > usable_width or height > usable_height:
+                if (not rotate or height > usable_width or
+                        width > usable_height):
+                    raise StitcherError('Image too large for the page')
+                width, height, rotated = height, width, True
+            item_set.append((index, width, height, rotated))
+        item_set.sort(key=lambda item: -item[2])
+
+        # Each page is a list of shelves, each shelf a list of its top, its
+        # height, the width taken and its items
+        page_set = []
+        for item in item_set:
+            index, width, height, rotated = item
+            shelf = cls._find_shelf(
+                page_set, width, height, usable_width, usable_height)
+            if shelf is None:
+                shelf = [0, height, 0, []]
+                page_set.append([shelf])
+            shelf[3].append((shelf[2], item))
+            shelf[2] = shelf[2] + width
+
+        return [
+            cls._create_page(page_config, shelf_set)
+            for shelf_set in page_set]
+
+    @classmethod
+    def _find_shelf(
+            cls, page_set, width, height, usable_width, usable_height):
+        """
+        Find the shelf to place an image on, opening a new shelf on a page
+        that has room for it.
+
+        :param list page_set: The pages packed so far.
+        :param float width: The width of the image in inches.
+        :param float height: The height of the image in inches.
+        :param float usable_width: The width of the printable area.
+        :param float usable_height: The height of the printable area.
+        :returns: The shelf, or None if a new page is needed.
+        :rtype: list
+        """
+        for shelf_set in page_set:
+            for shelf in shelf_set:
+                if height <= shelf[1] and shelf[2] + width <= usable_width:
+                    return shelf
+
+            bottom = shelf_set[-1][0] + shelf_set[-1][1]
+            if bottom + height <= usable_height:
+                shelf = [bottom, height, 0, []]
+                shelf_set.append(shelf)
+                return shelf
+
+        return None
+
+    @classmethod
+    def _create_page(cls, page_config, shelf_set):
+        """
+        Create the layout of a packed page.
+
+        :param dict page_config: The page configuration.
+        :param list shelf_set: The shelves of the page.
+        :returns: A 2-tuple containing the indexes of the images on the page
+            and the layout of the page.
+        :rtype: tuple
+        """
+        index_set = []
+        layout = cls(
+            array('d'), array('d'), array('d'), array('d'), array('d'),
+            array('b'), array('d'))
+        for shelf_y, shelf_height, shelf_width, placement_set in shelf_set:
+            for x_pos, (index, width, height, rotated) in placement_set:
+                x_pos = x_pos + page_config['margin_x']
+                index_set.append(index)
+                if rotated:
+                    layout.image_width.append(height)
+                    layout.image_height.append(width)
+                else:
+                    layout.image_width.append(width)
+                    layout.image_height.append(height)
+                layout.slot_x.append(x_pos)
+                layout.slot_x_rtl.append(
+                    page_config['width'] - x_pos - width)
+                layout.slot_y.append(shelf_y + page_config['margin_y'])
+                layout.slot_rotated.append(rotated)
+                layout.row_height.append(shelf_height)
+
+        return index_set, layout
+
+    def image_dimension(self, index):
+        """
+        Get the dimension of the image in a slot, before it is rotated.
+
+        :param int index: The index of the slot on the page.
+        :returns: A 2-tuple containing the width and height in inches.
+        :rtype: tuple
+        """
+        return self.image_width[index], self.image_height[index]
@@ -0,0 +1,135 @@
+from collections import namedtuple
+from pnpstitcher.exception import StitcherError
+from voluptuous import (
+    All,
+    Any,
+    Coerce,
+    Invalid,
+    Optional,
+    Range,
+    Required,
+    Schema)
+import csv
+import json
+import os.path
+
+
+ManifestEntry = namedtuple('ManifestEntry', ['path', 'count', 'back'])
+
+_ENTRY_SCHEMA = Schema({
+    Required('path'): str,
+    Optional('count', default=1): All(Coerce(int), Range(min=1)),
+    Optional('back', default=None): Any(None, str),
+})
+
+
+def read_manifest(filename):
+    """
+    Read a manifest of the images to be stitched.
+
+    A manifest lists every image once together with the number of copies to
+    place, and optionally the image on its back. It is either a CSV file with
+    a header row naming the "path", "count" and "back" columns, or a JSON
+    list of objects with the same keys. Relative paths are relative to the
+    manifest itself.
+
+    :param str filename: The filename of the manifest, either .csv or .json.
+    :returns: The list of manifest entries.
+    :rtype: list
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    try:
+        with open(filename, newline='') as fp:
+            if ext == '.csv':
+                row_set = list(csv.DictReader(fp))
+            elif ext == '.json':
+                row_set = json.load(fp)
+            else:
+                raise StitcherError(
+                    'Unsupported manifest format. File: {}'.format(filename))
+    except ValueError as e:
+        raise StitcherError(
+            'Unable to read the manifest. File: {}, {}'.format(filename, e))
+
+    if not isinstance(row_set, list):
+        raise StitcherError(
+            'The manifest should be a list of images. File: {}'.format(
+                filename))
+
+    if not row_set:
+        raise StitcherError(
+            'The manifest lists no images. File: {}'.format(filename))
+
+    base_dir = os.path.dirname(filename)
+    entry_set = []
+    for line_number, row in enumerate(row_set, 1):
+        try:
+            # Empty CSV cells are left out, so they take their default
+            entry = _ENTRY_SCHEMA(dict(
+                (key, value) for key, value in dict(row).items()
+                if key is not None and value not in (None, '')))
+        except (Invalid, TypeError, ValueError) as e:
+            raise StitcherError(
+                'Invalid manifest entry {}. File: {}, {}'.format(
+                    line_number, filename, e))
+
+        entry_set.append(ManifestEntry(
+            _resolve_path(base_dir, entry['path']), entry['count'],
+            entry['back'] and _resolve_path(base_dir, entry['back'])))
+
+    missing_set = sorted(set(
+        path
+        for entry in entry_set
+        for path in (entry.path, entry.back)
+        if path and not os.path.isfile(path)))
+    if missing_set:
+        raise StitcherError(
+            'Missing images in the manifest. Files: {}'.format(
+                ', '.join(missing_set)))
+
+    return entry_set
+
+
+def expand_manifest(entry_set, back_filename=None):
+    """
+    Expand the manifest entries into one filename for every card.
+
+    The copies of an image all refer to the same filename, next to each
+    other, so the image catalog reads the image once and hands the same
+    image out for all of them.
+
+    :param list entry_set: The list of manifest entries.
+    :param str back_filename: The back image of the entries without one.
+    :returns: A 2-tuple containing the filenames of the fronts and the
+        filenames of the backs, an empty list when there are no backs.
+    :rtype: tuple
+    """
+    filename_set = []
+    back_filename_set = []
+    has_back = back_filename is not None or any(
+        entry.back for entry in entry_set)
+    for entry in entry_set:
+        filename_set.extend([entry.path] * entry.count)
+        if not has_back:
+            continue
+
+        back = entry.back or back_filename
+        if back is None:
+            raise StitcherError(
+                'Missing back image in the manifest. File: {}'.format(
+                    entry.path))
+        back_filename_set.extend([back] * entry.count)
+
+    return filename_set, back_filename_set
+
+
+def _resolve_path(base_dir, path):
+    """
+    Resolve a path in the manifest.
+
+    :param str base_dir: The directory of the manifest.
+    :param str path: The path, absolute or relative to the manifest.
+    :returns: The path.
+    :rtype: str
+    """
+    return os.path.join(base_dir, os.path.expanduser(path))
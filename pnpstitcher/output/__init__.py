@@ -1,3 +1,38 @@
 from pnpstitcher.output.base import BaseGenerator
-from pnpstitcher.output.pdf import PdfGenerator
-from pnpstitcher.output.svg import SvgGenerator
+from pnpstitcher.output.parallel import ParallelGenerator
+import importlib
+
+
+# The backends are only imported once they are used, so that only the
+# dependencies of the chosen format are loaded
+_GENERATOR_SET = {
+    'pdf': ('pnpstitcher.output.pdf', 'PdfGenerator'),
+    'svg': ('pnpstitcher.output.svg', 'SvgGenerator'),
+    'png': ('pnpstitcher.output.raster', 'PngGenerator'),
+    'tiff': ('pnpstitcher.output.raster', 'TiffGenerator'),
+}
+
+
+def get_generator(file_format):
+    """
+    Get the output generator of a file format.
+
+    :param str file_format: The file format.
+    :returns: The output generator class.
+    :rtype: type
+    """
+    try:
+        module_name, class_name = _GENERATOR_SET[file_format]
+    except KeyError:
+        raise RuntimeError('Unsupported output file format')
+
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def __getattr__(name):
+    for file_format, (module_name, class_name) in _GENERATOR_SET.items():
+        if class_name == name:
+            return get_generator(file_format)
+
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
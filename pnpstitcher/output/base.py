@@ -1,10 +1,14 @@
 from abc import ABCMeta
+from pnpstitcher.exception import StitcherError
+from pnpstitcher.stats import Stats
 
 
 class BaseGenerator(object):
     __metaclass__ = ABCMeta
 
-    def __init__(self, filename, cutline_generator, page_config, page_dpi):
+    def __init__(
+            self, filename, cutline_generator, page_config, page_dpi,
+            first_page=1):
         """
         Constructor.
 
@@ -12,74 +16,142 @@ class BaseGenerator(object):
         :param CutlineGenerator cutline_generator: The cutline generator.
         :param dict page_config: The page configuration.
         :param int page_dpi: The page dpi.
+        :param int first_page: The number of the first page rendered.
         """
         self.filename = filename
+        self.first_page = first_page
         self.cutline_generator = cutline_generator
         self.page_config = page_config
         self.image_dpi = page_config['dpi']
         self.page_dpi = page_dpi
         self.image_scale = self.page_dpi / self.image_dpi
+        self.stats = Stats()
 
     def generate(
             self, image_catalog, cutline_config, registration_config,
-            rtl=False):
+            rtl=False, back_catalog=None, page_range=None):
         """
         Generate the output file.
 
+        With a back catalog, every page is followed by a page of the backs of
+        its images for duplex printing, laid out in the opposite direction.
+
         :param ImageCatalog image_catalog: The loaded image database.
         :param dict cutline_config: The cutline configuration.
         :param dict registration_config: The registration mark configuration.
         :param bool rtl: Layout the images from right-to-left.
+        :param ImageCatalog back_catalog: The images on the back of the cards.
+        :param tuple page_range: A 2-tuple containing the index of the first
+            sheet and the index after the last sheet to generate, defaults
+            to every sheet.
+        """
+        card_count = len(image_catalog)
+        if back_catalog is not None and len(back_catalog) != card_count:
+            raise StitcherError(
+                'The number of back images does not match the front')
+        if page_range is None:
+            page_range = (0, self.cutline_generator.page_count(card_count))
+
+        page_number = self.first_page
+        for page_index in range(*page_range):
+            page_plan = self.cutline_generator.page_plan(
+                page_index, card_count)
+            self._generate_page(
+                image_catalog.select(page_plan.index_set), page_plan,
+                page_number, cutline_config, registration_config, rtl)
+            page_number = page_number + 1
+
+            if back_catalog is not None:
+                self._generate_page(
+                    back_catalog.select(page_plan.index_set), page_plan,
+                    page_number, cutline_config, registration_config,
+                    not rtl)
+                page_number = page_number + 1
+
+        with self.stats.phase('finalize_document'):
+            self._finalize_document()
+
+    def _generate_page(
+            self, image_catalog, page_plan, page_number, cutline_config,
+            registration_config, rtl):
+        """
+        Generate a page.
+
+        :param ImageCatalog image_catalog: The images on the page.
+        :param PagePlan page_plan: The layout and cutlines of the page.
+        :param int page_number: The page number.
+        :param dict cutline_config: The cutline configuration.
+        :param dict registration_config: The registration mark configuration.
+        :param bool rtl: Layout the images from right-to-left.
         """
         # Initialize all the page detail
-        image_width = image_catalog.image_size[0] / self.image_dpi
-        image_height = image_catalog.image_size[1] / self.image_dpi
-        origin_x = self.cutline_generator.cut_margin_x
-        x_inc = image_width
+        layout = page_plan.layout
         if rtl:
-            origin_x = (
-                origin_x +
-                (image_width * (self.cutline_generator.card_num_x - 1)))
-            x_inc = -image_width
+            cutline_set = page_plan.cutline_set_rtl
+        else:
+            cutline_set = page_plan.cutline_set
+
+        # Draw cut lines at the bottom of the fresh page
+        self.stats.start_page(page_number)
+        with self.stats.phase('initialize_page'):
+            self._initialize_page()
+        if cutline_config['layer'] == 'bottom':
+            with self.stats.phase('draw_cutlines'):
+                self._draw_cutlines(cutline_set, cutline_config)
 
         # Generate the images
-        x_cnt = 0
-        y_cnt = 0
-        x_pos = origin_x
-        y_pos = self.cutline_generator.cut_margin_y
-        for pil_image in image_catalog.image_set:
-            # Draw cut lines if it's a fresh page
-            if x_cnt == 0 and y_cnt == 0:
-                self._initialize_page()
-                if cutline_config['layer'] == 'bottom':
-                    self._draw_cutlines(
-                        self.cutline_generator.cutline_set, cutline_config)
-
-            # Draw the image
+        image_set = self.stats.timed_iter('open_image', image_catalog)
+        for index, pil_image in enumerate(image_set):
             if self.page_config['mode'] in ('full', 'image'):
-                self._draw_image(
-                    pil_image, x_pos, y_pos, (image_width, image_height))
-
-            # Switch to next row when it is happening
-            x_cnt = x_cnt + 1
-            x_pos = x_pos + x_inc
-            if x_cnt >= self.cutline_generator.card_num_x:
-                x_cnt = 0
-                y_cnt = y_cnt + 1
-
-                x_pos = origin_x
-                y_pos = y_pos + image_height
-
-            # If we got past the page threshold, we would need to cease it
-            if y_cnt >= self.cutline_generator.card_num_y:
-                y_cnt = 0
-                y_pos = self.cutline_generator.cut_margin_y
-                self._finalize_page(cutline_config, registration_config)
-
-        # After we hit the last page and if there's some left-over that is not
-        # rendered, we should do it now.
-        if x_cnt != 0 or y_cnt != 0:
-            self._finalize_page(cutline_config, registration_config)
+                x_pos, y_pos = layout.slot(index, rtl)
+                with self.stats.phase('draw_image'):
+                    self._draw_image(
+                        pil_image, x_pos, y_pos,
+                        layout.image_dimension(index),
+                        layout.slot_rotation(index, rtl))
+                self.stats.add_page_image()
+
+        self._finalize_page(cutline_set, cutline_config, registration_config)
+
+    @classmethod
+    def partial_filename(cls, filename, work_dir, first_page):
+        """
+        Get the filename of a partial output when rendering in parallel.
+
+        :param str filename: The filename of the final output.
+        :param str work_dir: The directory for the intermediate files.
+        :param int first_page: The number of the first page of the partial
+            output.
+        :returns: The filename of the partial output.
+        :rtype: str
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def partial_output_set(cls, filename, work_dir, first_page, page_count):
+        """
+        Get the files that make up a partial output.
+
+        :param str filename: The filename of the final output.
+        :param str work_dir: The directory for the intermediate files.
+        :param int first_page: The number of the first page of the partial
+            output.
+        :param int page_count: The number of pages in the partial output.
+        :returns: The filenames.
+        :rtype: list
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def merge_partials(cls, filename, partial_filename_set):
+        """
+        Merge the partial outputs rendered in parallel into the final output.
+
+        :param str filename: The filename of the final output.
+        :param list partial_filename_set: The filenames of the partial outputs
+            in page order.
+        """
+        raise NotImplementedError()
 
     def _initialize_page(self):
         """
@@ -93,7 +165,13 @@ class BaseGenerator(object):
         """
         raise NotImplemented()
 
-    def _draw_image(self, image, x_pos, y_pos, image_dimension):
+    def _finalize_document(self):
+        """
+        Finalize the document after the last page is rendered.
+        """
+        return
+
+    def _draw_image(self, image, x_pos, y_pos, image_dimension, rotation=0):
         """
         Draw image onto page.
 
@@ -102,6 +180,8 @@ class BaseGenerator(object):
         :param int y_pos: The y position in inches.
         :param list image_dimension: A 2-tuple containing the image width and
             height.
+        :param int rotation: The clockwise rotation of the image in degrees,
+            the position is the top-left corner of the rotated image.
         """
         raise NotImplemented()
 
@@ -171,18 +251,23 @@ class BaseGenerator(object):
         else:
             raise RuntimeError('Unexpected registration mark type')
 
-    def _finalize_page(self, cutline_config, registration_config):
+    def _finalize_page(
+            self, cutline_set, cutline_config, registration_config):
         """
         Finalize the drawing in the page.
 
+        :param list cutline_set: The list of cutlines of the page.
         :param dict cutline_config: The cutline configuration.
         :param dict registration_config: The registration mark configuration.
         """
         if cutline_config['layer'] == 'top':
-            self._draw_cutlines(
-                self.cutline_generator.cutline_set, cutline_config)
+            with self.stats.phase('draw_cutlines'):
+                self._draw_cutlines(cutline_set, cutline_config)
 
         if self.page_config['registration']:
-            self._draw_registration(registration_config)
+            with self.stats.phase('draw_registration'):
+                self._draw_registration(registration_config)
 
-        self._render_page()
+        with self.stats.phase('render_page'):
+            self._render_page()
+        self.stats.end_page()
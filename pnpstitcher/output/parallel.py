@@ -0,0 +1,201 @@
+from concurrent.futures import ProcessPoolExecutor
+from pnpstitcher.cache import cache_key
+from pnpstitcher.image import content_hash
+from pnpstitcher.stats import Stats
+import math
+import os.path
+import shutil
+import tempfile
+
+
+def _render_partial(
+        generator_class, filename, cutline_generator, page_config, page_dpi,
+        first_page, options, image_catalog, cutline_config,
+        registration_config, rtl, back_catalog, page_range):
+    """
+    Render a range of pages, to be run in a worker process.
+
+    :returns: The stats of the rendering.
+    :rtype: dict
+    """
+    output_generator = generator_class(
+        filename, cutline_generator, page_config, page_dpi, first_page,
+        **options)
+    output_generator.generate(
+        image_catalog, cutline_config, registration_config, rtl,
+        back_catalog, page_range)
+    return output_generator.stats.as_dict()
+
+
+class ParallelGenerator(object):
+    """
+    Render the pages as separate partial outputs.
+
+    The deck is split into contiguous page ranges that are rendered
+    independently by the output generator and then merged in order. Every
+    page range refers to the pages of the whole deck by their index, which
+    works the same for the grid and the packed layouts. The page ranges are
+    rendered by a pool of worker processes when there is more than one job.
+
+    With a page cache, every sheet is rendered on its own so that the pages
+    whose input haven't changed are taken from the cache instead.
+    """
+
+    def __init__(
+            self, generator_class, jobs, filename, cutline_generator,
+            page_config, page_dpi, page_cache=None, **options):
+        """
+        Constructor.
+
+        :param type generator_class: The output generator class.
+        :param int jobs: The number of worker processes.
+        :param str filename: The filename of the output file.
+        :param CutlineGenerator cutline_generator: The cutline generator.
+        :param dict page_config: The page configuration.
+        :param int page_dpi: The page dpi.
+        :param PageCache page_cache: The cache of rendered pages.
+        :param options: The extra options of the output generator.
+        """
+        self.generator_class = generator_class
+        self.jobs = jobs
+        self.filename = filename
+        self.cutline_generator = cutline_generator
+        self.page_config = page_config
+        self.page_dpi = page_dpi
+        self.page_cache = page_cache
+        self.options = options
+        self.stats = Stats()
+
+    def generate(
+            self, image_catalog, cutline_config, registration_config,
+            rtl=False, back_catalog=None):
+        """
+        Generate the output file.
+
+        :param ImageCatalog image_catalog: The loaded image database.
+        :param dict cutline_config: The cutline configuration.
+        :param dict registration_config: The registration mark configuration.
+        :param bool rtl: Layout the images from right-to-left.
+        :param ImageCatalog back_catalog: The images on the back of the cards.
+        """
+        sheet_count = self.cutline_generator.page_count(len(image_catalog))
+        side_count = 1 if back_catalog is None else 2
+        if self.page_cache is None:
+            chunk_count = max(min(self.jobs, sheet_count), 1)
+            sheet_per_chunk = int(math.ceil(sheet_count / chunk_count))
+        else:
+            chunk_count = sheet_count
+            sheet_per_chunk = 1
+
+        work_dir = tempfile.mkdtemp(
+            prefix='.pnpstitch-',
+            dir=os.path.dirname(os.path.abspath(self.filename)))
+        try:
+            partial_filename_set = []
+            task_set = []
+            for index in range(chunk_count):
+                page_range = (
+                    index * sheet_per_chunk,
+                    min((index + 1) * sheet_per_chunk, sheet_count))
+                if page_range[0] >= page_range[1]:
+                    continue
+
+                first_page = page_range[0] * side_count + 1
+                partial_fn = self.generator_class.partial_filename(
+                    self.filename, work_dir, first_page)
+                partial_filename_set.append(partial_fn)
+
+                if self.page_cache is not None:
+                    output_set = self.generator_class.partial_output_set(
+                        self.filename, work_dir, first_page, side_count)
+                    key = self._page_key(
+                        image_catalog, back_catalog, page_range[0],
+                        cutline_config, registration_config, rtl)
+                    with self.stats.phase('restore_page'):
+                        restored = self.page_cache.restore(key, output_set)
+                    if restored:
+                        continue
+                else:
+                    output_set = key = None
+
+                task_set.append(((
+                    self.generator_class,
+                    partial_fn,
+                    self.cutline_generator,
+                    self.page_config,
+                    self.page_dpi,
+                    first_page,
+                    self.options,
+                    image_catalog,
+                    cutline_config,
+                    registration_config,
+                    rtl,
+                    back_catalog,
+                    page_range), output_set, key))
+
+            self._render(task_set)
+            with self.stats.phase('merge_partials'):
+                self.generator_class.merge_partials(
+                    self.filename, partial_filename_set)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _render(self, task_set):
+        """
+        Render the partial outputs, storing the rendered pages in the cache.
+
+        :param list task_set: The list of 3-tuple containing the arguments to
+            render the partial output, the files of the page and the cache
+            key of the page.
+        """
+        if self.jobs > 1 and len(task_set) > 1:
+            with ProcessPoolExecutor(self.jobs) as executor:
+                future_set = [
+                    executor.submit(_render_partial, *args)
+                    for args, output_set, key in task_set]
+                for future in future_set:
+                    self.stats.merge(future.result())
+        else:
+            for args, output_set, key in task_set:
+                self.stats.merge(_render_partial(*args))
+
+        if self.page_cache is not None:
+            with self.stats.phase('store_page'):
+                for args, output_set, key in task_set:
+                    self.page_cache.store(key, output_set)
+
+    def _page_key(
+            self, image_catalog, back_catalog, page_index, cutline_config,
+            registration_config, rtl):
+        """
+        Get the cache key of a page.
+
+        :param ImageCatalog image_catalog: The loaded image database.
+        :param ImageCatalog back_catalog: The images on the back of the cards.
+        :param int page_index: The index of the page.
+        :param dict cutline_config: The cutline configuration.
+        :param dict registration_config: The registration mark configuration.
+        :param bool rtl: Layout the images from right-to-left.
+        :returns: The cache key.
+        :rtype: str
+        """
+        page_plan = self.cutline_generator.page_plan(
+            page_index, len(image_catalog))
+        image_catalog = image_catalog.select(page_plan.index_set)
+        if back_catalog is not None:
+            back_catalog = back_catalog.select(page_plan.index_set)
+
+        return cache_key(
+            self.generator_class.__name__,
+            os.path.abspath(self.filename),
+            self.page_config,
+            self.page_dpi,
+            self.options,
+            cutline_config,
+            registration_config,
+            rtl,
+            page_plan.layout,
+            page_plan.cutline_set,
+            [content_hash(fn) for fn in image_catalog.filename_set],
+            (back_catalog is not None and
+                [content_hash(fn) for fn in back_catalog.filename_set]))
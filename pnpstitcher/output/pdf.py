@@ -1,11 +1,27 @@
+from pnpstitcher.cache import LRUCache, cache_key
+from pnpstitcher.header import read_image_header
+from pnpstitcher.image import content_hash
 from pnpstitcher.output.base import BaseGenerator
 from tinycss2.color3 import parse_color
 import cairocffi as cairo
 import math
+import os.path
 
 
 class PdfGenerator(BaseGenerator):
-    def __init__(self, filename, cutline_generator, page_config, page_dpi):
+    # Cairo identifies repeated sources by this MIME type, so an image that
+    # got evicted from the surface cache would still be embedded only once.
+    MIME_TYPE_UNIQUE_ID = 'application/x-cairo.uuid'
+    MIME_TYPE_JPEG = 'image/jpeg'
+    SURFACE_CACHE_SIZE = 64
+
+    # Shared by the generators within the process unless a cache is given,
+    # so that the decoded images stay warm across documents
+    _shared_surface_cache = LRUCache(SURFACE_CACHE_SIZE)
+
+    def __init__(
+            self, filename, cutline_generator, page_config, page_dpi,
+            first_page=1, surface_cache=None):
         """
         Constructor.
 
@@ -13,9 +29,16 @@ class PdfGenerator(BaseGenerator):
         :param CutlineGenerator cutline_generator: The cutline generator.
         :param dict page_config: The page configuration.
         :param int page_dpi: The page dpi.
+        :param int first_page: The number of the first page rendered.
+        :param LRUCache surface_cache: The cache of decoded image surfaces,
+            keyed by the content hash of the image file. Defaults to the
+            cache shared within the process.
         """
         super(PdfGenerator, self).__init__(
-            filename, cutline_generator, page_config, page_dpi)
+            filename, cutline_generator, page_config, page_dpi, first_page)
+        if surface_cache is None:
+            surface_cache = self._shared_surface_cache
+        self.surface_cache = surface_cache
 
         # Set the page and drawing context
         self._pdf = cairo.PDFSurface(
@@ -24,7 +47,58 @@ class PdfGenerator(BaseGenerator):
             page_config['height'] * page_dpi)
         self._context = cairo.Context(self._pdf)
 
-    def _draw_image(self, pil_image, x_pos, y_pos, image_dimension):
+        # The layers that are the same on every page, recorded once
+        self._template_set = {}
+
+    @classmethod
+    def partial_filename(cls, filename, work_dir, first_page):
+        """
+        Get the filename of a partial output when rendering in parallel.
+
+        :param str filename: The filename of the final output.
+        :param str work_dir: The directory for the intermediate files.
+        :param int first_page: The number of the first page of the partial
+            output.
+        :returns: The filename of the partial output.
+        :rtype: str
+        """
+        return os.path.join(work_dir, 'part{:05d}.pdf'.format(first_page))
+
+    @classmethod
+    def partial_output_set(cls, filename, work_dir, first_page, page_count):
+        """
+        Get the files that make up a partial output.
+
+        :param str filename: The filename of the final output.
+        :param str work_dir: The directory for the intermediate files.
+        :param int first_page: The number of the first page of the partial
+            output.
+        :param int page_count: The number of pages in the partial output.
+        :returns: The filenames.
+        :rtype: list
+        """
+        return [cls.partial_filename(filename, work_dir, first_page)]
+
+    @classmethod
+    def merge_partials(cls, filename, partial_filename_set):
+        """
+        Merge the partial outputs rendered in parallel into the final output.
+
+        :param str filename: The filename of the final output.
+        :param list partial_filename_set: The filenames of the partial outputs
+            in page order.
+        """
+        # Only needed when merging, so it's not loaded for a serial run
+        from pdfrw import PdfReader
+        from pnpstitcher.pdfstream import PdfStreamWriter
+
+        with PdfStreamWriter(filename) as output_pdf:
+            for partial_fn in partial_filename_set:
+                for page in PdfReader(partial_fn).pages:
+                    output_pdf.add_page(page, source=partial_fn)
+
+    def _draw_image(
+            self, pil_image, x_pos, y_pos, image_dimension, rotation=0):
         """
         Draw image onto page.
 
@@ -33,15 +107,75 @@ class PdfGenerator(BaseGenerator):
         :param int y_pos: The y position in inches.
         :param list image_dimension: A 2-tuple containing the image width and
             height.
+        :param int rotation: The clockwise rotation of the image in degrees,
+            the position is the top-left corner of the rotated image.
         """
         self._context.save()
-        image = cairo.ImageSurface.create_from_png(pil_image.fp.name)
-        self._context.scale(self.image_scale, self.image_scale)
-        self._context.set_source_surface(
-            image, x_pos * self.image_dpi, y_pos * self.image_dpi)
+        image = self._load_surface(pil_image.filename, pil_image.format)
+
+        # Scale by the size of the surface rather than the page dpi, as the
+        # image may have been resampled to a lower resolution
+        self._context.translate(x_pos * self.page_dpi, y_pos * self.page_dpi)
+        if rotation == 90:
+            self._context.translate(image_dimension[1] * self.page_dpi, 0)
+        elif rotation == 270:
+            self._context.translate(0, image_dimension[0] * self.page_dpi)
+        self._context.rotate(math.radians(rotation))
+        self._context.scale(
+            image_dimension[0] * self.page_dpi / image.get_width(),
+            image_dimension[1] * self.page_dpi / image.get_height())
+        self._context.set_source_surface(image, 0, 0)
         self._context.paint()
         self._context.restore()
 
+    def _load_surface(self, filename, image_format):
+        """
+        Load the image surface, decoding the file only if the same content
+        hasn't been seen before.
+
+        :param str filename: The filename of the PNG or JPEG image.
+        :param str image_format: The image format as identified by PIL.
+        :returns: The image surface.
+        :rtype: cairo.ImageSurface
+        """
+        key = content_hash(filename)
+        surface = self.surface_cache.get(key)
+        if surface is None:
+            if image_format == 'JPEG':
+                surface = self._load_jpeg_surface(filename)
+            else:
+                with self.stats.phase('decode_png'):
+                    surface = cairo.ImageSurface.create_from_png(filename)
+                self.stats.add_bytes(
+                    'decode_png', os.path.getsize(filename))
+            surface.set_mime_data(
+                self.MIME_TYPE_UNIQUE_ID, key.encode('ascii'))
+            self.surface_cache.put(key, surface)
+
+        return surface
+
+    def _load_jpeg_surface(self, filename):
+        """
+        Load a JPEG image as a surface that is embedded as is.
+
+        The original JPEG data is attached to a blank surface of the same
+        size, which cairo embeds into the PDF as the DCT stream without
+        decoding or re-encoding it.
+
+        :param str filename: The filename of the JPEG image.
+        :returns: The image surface.
+        :rtype: cairo.ImageSurface
+        """
+        with self.stats.phase('load_jpeg'):
+            header = read_image_header(filename)
+            with open(filename, 'rb') as fp:
+                data = fp.read()
+            surface = cairo.ImageSurface(
+                cairo.FORMAT_RGB24, header.width, header.height)
+            surface.set_mime_data(self.MIME_TYPE_JPEG, data)
+        self.stats.add_bytes('load_jpeg', len(data))
+        return surface
+
     def _initialize_page(self):
         """
         Start a fresh page.
@@ -55,10 +189,63 @@ class PdfGenerator(BaseGenerator):
         """
         self._pdf.show_page()
 
+    def _finalize_document(self):
+        """
+        Finalize the document after the last page is rendered.
+        """
+        self._pdf.finish()
+
+    def _stamp_template(self, key, draw, *args):
+        """
+        Paint a layer that is the same on every page.
+
+        The layer is drawn once onto a recording surface, which cairo embeds
+        into the PDF once and refers to from every page, instead of drawing
+        the whole layer again on every page.
+
+        :param str key: The key of the layer.
+        :param callable draw: The method that draws the layer.
+        :param args: The arguments of the method.
+        """
+        template = self._template_set.get(key)
+        if template is None:
+            template = cairo.RecordingSurface(
+                cairo.CONTENT_COLOR_ALPHA,
+                (0, 0,
+                    self.page_config['width'] * self.page_dpi,
+                    self.page_config['height'] * self.page_dpi))
+            page_context = self._context
+            self._context = cairo.Context(template)
+            try:
+                draw(*args)
+            finally:
+                self._context = page_context
+            self._template_set[key] = template
+
+        self._context.save()
+        self._context.set_source_surface(template, 0, 0)
+        self._context.paint()
+        self._context.restore()
+
     def _draw_cutlines(self, cutline_set, cutline_config):
         """
         Draw cutlines.
 
+        :param list cutline_set: The list of cutlines.
+        :param dict cutline_config: The cutline configuration.
+        """
+        # If it's image mode, we would skip this
+        if not self.page_config['mode'] in ('full', 'cutline'):
+            return
+
+        self._stamp_template(
+            cache_key('cutlines', cutline_set, cutline_config),
+            self._record_cutlines, cutline_set, cutline_config)
+
+    def _record_cutlines(self, cutline_set, cutline_config):
+        """
+        Draw the cutlines onto the template.
+
         :param list cutline_set: The list of cutlines.
         :param dict cutline_config: The cutline configuration.
         """
@@ -66,6 +253,17 @@ class PdfGenerator(BaseGenerator):
         super(PdfGenerator, self)._draw_cutlines(cutline_set, cutline_config)
         self._context.stroke()
 
+    def _draw_registration(self, registration_config):
+        """
+        Draw a registration mark.
+
+        :param dict registration_config: The registration mark configuration.
+        """
+        self._stamp_template(
+            cache_key('registration', registration_config),
+            super(PdfGenerator, self)._draw_registration,
+            registration_config)
+
     def _draw_cutlines_cutthrough(self, cutline_set, cutline_config):
         """
         Draw cut-through cutlines.
@@ -0,0 +1,387 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw
+from pnpstitcher.cutpath import arc_points, rectangle_points
+from pnpstitcher.output.base import BaseGenerator
+from tinycss2.color3 import parse_color
+import math
+import os
+import os.path
+
+
+class RasterGenerator(BaseGenerator):
+    """
+    Composite the pages straight into bitmaps, one file per page.
+
+    The drawing of a page is recorded while the page is laid out, and the
+    page is composited and encoded in a thread pool as soon as it is
+    rendered, so several pages are worked on at once.
+    """
+    IMAGE_FORMAT = None
+    EXTENSION = None
+    SAVE_OPTIONS = {}
+
+    BACKGROUND_COLOR = (255, 255, 255)
+    REGISTRATION_COLOR = (0, 0, 0)
+
+    # Matches the 4pt dashes of the PDF output
+    DASH_LENGTH = 4 / 72
+
+    # PIL rotates counter-clockwise
+    TRANSPOSE_SET = {
+        90: Image.ROTATE_270,
+        270: Image.ROTATE_90,
+    }
+
+    def __init__(
+            self, filename, cutline_generator, page_config, page_dpi,
+            first_page=1, threads=None):
+        """
+        Constructor.
+
+        :param str filename: The filename of the output file.
+        :param CutlineGenerator cutline_generator: The cutline generator.
+        :param dict page_config: The page configuration.
+        :param int page_dpi: The page dpi, which is the resolution of the
+            bitmaps.
+        :param int first_page: The number of the first page rendered.
+        :param int threads: The number of threads to composite the pages
+            with, defaults to the number of processors.
+        """
+        super(RasterGenerator, self).__init__(
+            filename, cutline_generator, page_config, page_dpi, first_page)
+        self._page_number = first_page
+        self.threads = threads or os.cpu_count() or 1
+        self.page_size = (
+            round(page_config['width'] * page_dpi),
+            round(page_config['height'] * page_dpi))
+        self._executor = ThreadPoolExecutor(self.threads)
+        self._pending_set = deque()
+        self._page_filename = None
+        self._operation_set = None
+        self._cutline_style = None
+
+    @classmethod
+    def partial_filename(cls, filename, work_dir, first_page):
+        """
+        Get the filename of a partial output when rendering in parallel.
+
+        Every page is a file of its own, so the partial outputs are written
+        straight to the final filename.
+
+        :param str filename: The filename of the final output.
+        :param str work_dir: The directory for the intermediate files.
+        :param int first_page: The number of the first page of the partial
+            output.
+        :returns: The filename of the partial output.
+        :rtype: str
+        """
+        return filename
+
+    @classmethod
+    def partial_output_set(cls, filename, work_dir, first_page, page_count):
+        """
+        Get the files that make up a partial output.
+
+        :param str filename: The filename of the final output.
+        :param str work_dir: The directory for the intermediate files.
+        :param int first_page: The number of the first page of the partial
+            output.
+        :param int page_count: The number of pages in the partial output.
+        :returns: The filenames.
+        :rtype: list
+        """
+        return [
+            cls.page_filename(filename, page_number)
+            for page_number in range(first_page, first_page + page_count)]
+
+    @classmethod
+    def page_filename(cls, filename, page_number):
+        """
+        Get the filename of a page.
+
+        :param str filename: The filename of the output.
+        :param int page_number: The page number.
+        :returns: The filename of the page.
+        :rtype: str
+        """
+        return '{}__page{:03d}{}'.format(
+            os.path.splitext(filename)[0], page_number, cls.EXTENSION)
+
+    @classmethod
+    def merge_partials(cls, filename, partial_filename_set):
+        """
+        Merge the partial outputs rendered in parallel into the final output.
+
+        :param str filename: The filename of the final output.
+        :param list partial_filename_set: The filenames of the partial outputs
+            in page order.
+        """
+        # DOES NOTHING, the pages are already written in place.
+        return
+
+    def _initialize_page(self):
+        """
+        Start a fresh page.
+        """
+        self._page_filename = self.page_filename(
+            self.filename, self._page_number)
+        self._page_number = self._page_number + 1
+        self._operation_set = []
+
+    def _render_page(self):
+        """
+        Render page.
+
+        The page is handed over to the thread pool, only waiting for the
+        oldest page when too many pages are in flight so the memory used by
+        the bitmaps stays bounded.
+        """
+        self._pending_set.append(self._executor.submit(
+            self._composite_page, self._page_filename, self._operation_set))
+        self._operation_set = None
+        while len(self._pending_set) > self.threads * 2:
+            self._pending_set.popleft().result()
+
+    def _finalize_document(self):
+        """
+        Finalize the document after the last page is rendered.
+        """
+        try:
+            while self._pending_set:
+                self._pending_set.popleft().result()
+        finally:
+            self._executor.shutdown()
+
+    def _composite_page(self, filename, operation_set):
+        """
+        Composite and write a page.
+
+        :param str filename: The filename of the page.
+        :param list operation_set: The drawing operations of the page, each
+            a 2-tuple of the method and its arguments.
+        """
+        page = Image.new('RGB', self.page_size, self.BACKGROUND_COLOR)
+        draw = ImageDraw.Draw(page)
+        for operation, args in operation_set:
+            operation(page, draw, *args)
+
+        page.save(
+            filename, format=self.IMAGE_FORMAT,
+            dpi=(self.page_dpi, self.page_dpi), **self.SAVE_OPTIONS)
+
+    def _paste_image(self, page, draw, filename, position, size, rotation):
+        """
+        Paste an image onto the page.
+
+        :param Image page: The page bitmap.
+        :param ImageDraw draw: The drawing context of the page.
+        :param str filename: The filename of the image.
+        :param tuple position: The position of the image in pixels.
+        :param tuple size: The size of the image in pixels, before it is
+            rotated.
+        :param int rotation: The clockwise rotation in degrees.
+        """
+        with Image.open(filename) as image:
+            if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+                image = image.convert('RGBA')
+            else:
+                image = image.convert('RGB')
+
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS)
+        if rotation:
+            image = image.transpose(self.TRANSPOSE_SET[rotation])
+
+        mask = image if image.mode == 'RGBA' else None
+        page.paste(image, position, mask)
+
+    def _stroke(self, page, draw, point_set, color, width, dashed):
+        """
+        Stroke a polyline onto the page.
+
+        :param Image page: The page bitmap.
+        :param ImageDraw draw: The drawing context of the page.
+        :param list point_set: The points of the polyline in pixels.
+        :param tuple color: The RGB color.
+        :param int width: The line width in pixels.
+        :param bool dashed: Draw a dashed line.
+        """
+        if dashed:
+            segment_set = self._dash(
+                point_set, self.DASH_LENGTH * self.page_dpi)
+        else:
+            segment_set = [point_set]
+
+        for segment in segment_set:
+            draw.line(segment, fill=color, width=width)
+
+    def _fill_rectangle(self, page, draw, box, color):
+        """
+        Fill a rectangle on the page.
+
+        :param Image page: The page bitmap.
+        :param ImageDraw draw: The drawing context of the page.
+        :param tuple box: The top-left and bottom-right corners in pixels.
+        :param tuple color: The RGB color.
+        """
+        draw.rectangle(box, fill=color)
+
+    def _draw_image(
+            self, pil_image, x_pos, y_pos, image_dimension, rotation=0):
+        """
+        Draw image onto page.
+
+        :param Image pil_image: The image.
+        :param int x_pos: The x position in inches.
+        :param int y_pos: The y position in inches.
+        :param list image_dimension: A 2-tuple containing the image width and
+            height.
+        :param int rotation: The clockwise rotation of the image in degrees,
+            the position is the top-left corner of the rotated image.
+        """
+        self._operation_set.append((self._paste_image, (
+            pil_image.filename,
+            (round(x_pos * self.page_dpi), round(y_pos * self.page_dpi)),
+            (round(image_dimension[0] * self.page_dpi),
+                round(image_dimension[1] * self.page_dpi)),
+            rotation)))
+
+    def _add_stroke(self, point_set, color, width, dashed=False):
+        """
+        Record the stroke of a polyline.
+
+        :param list point_set: The points of the polyline in inches.
+        :param tuple color: The RGB color.
+        :param int width: The line width in pixels.
+        :param bool dashed: Draw a dashed line.
+        """
+        point_set = [
+            (x * self.page_dpi, y * self.page_dpi) for x, y in point_set]
+        self._operation_set.append(
+            (self._stroke, (point_set, color, width, dashed)))
+
+    def _draw_cutlines(self, cutline_set, cutline_config):
+        """
+        Draw cutlines.
+
+        :param list cutline_set: The list of cutlines.
+        :param dict cutline_config: The cutline configuration.
+        """
+        self._cutline_style = (
+            tuple(
+                round(channel * 255)
+                for channel in parse_color(cutline_config['color'])[:3]),
+            max(1, round(cutline_config['width'] * self.page_dpi)),
+            cutline_config['dashed'])
+        super(RasterGenerator, self)._draw_cutlines(
+            cutline_set, cutline_config)
+
+    def _draw_cutlines_cutthrough(self, cutline_set, cutline_config):
+        """
+        Draw cut-through cutlines.
+
+        :param list cutline_set: The list of cutlines.
+        :param dict cutline_config: The cutline configuration.
+        """
+        for line in cutline_set:
+            self._add_stroke(
+                [(line.x0, line.y0), (line.x1, line.y1)],
+                *self._cutline_style)
+
+    def _draw_cutlines_inset(self, cutline_set, cutline_config):
+        """
+        Draw inset cutlines.
+
+        :param list cutline_set: The list of cutlines.
+        :param dict cutline_config: The cutline configuration.
+        """
+        for line in cutline_set:
+            point_set = rectangle_points(
+                line, cutline_config['round_corner'])
+            self._add_stroke(point_set, *self._cutline_style)
+
+    def _draw_registration_crosshair(self, registration_config):
+        """
+        Draw a crosshair registration mark.
+
+        :param dict registration_config: The registration mark configuration.
+        """
+        x_pos = registration_config['x_pos']
+        y_pos = registration_config['y_pos']
+        size = registration_config['size']
+        half_size = registration_config['size'] / 2
+        width = max(1, round(self.page_dpi / 72))
+
+        self._add_stroke(
+            [(x_pos + half_size, y_pos), (x_pos + half_size, y_pos + size)],
+            self.REGISTRATION_COLOR, width)
+        self._add_stroke(
+            [(x_pos, y_pos + half_size), (x_pos + size, y_pos + half_size)],
+            self.REGISTRATION_COLOR, width)
+        self._add_stroke(
+            arc_points(
+                x_pos + half_size, y_pos + half_size, size * 0.35, 0, 360),
+            self.REGISTRATION_COLOR, width)
+
+    def _draw_registration_square(self, registration_config):
+        """
+        Draw a square registration mark.
+
+        :param dict registration_config: The registration mark configuration.
+        """
+        x_pos = registration_config['x_pos'] * self.page_dpi
+        y_pos = registration_config['y_pos'] * self.page_dpi
+        size = registration_config['size'] * self.page_dpi
+        self._operation_set.append((self._fill_rectangle, (
+            (x_pos, y_pos, x_pos + size, y_pos + size),
+            self.REGISTRATION_COLOR)))
+
+    @classmethod
+    def _dash(cls, point_set, dash_length):
+        """
+        Split a polyline into dashes.
+
+        :param list point_set: The points of the polyline.
+        :param float dash_length: The length of the dashes and the gaps.
+        :returns: The polylines of the dashes.
+        :rtype: list
+        """
+        segment_set = []
+        segment = [point_set[0]]
+        drawing = True
+        remaining = dash_length
+        for (x0, y0), (x1, y1) in zip(point_set, point_set[1:]):
+            length = math.hypot(x1 - x0, y1 - y0)
+            offset = 0
+            while length - offset > remaining:
+                offset = offset + remaining
+                point = (
+                    x0 + (x1 - x0) * offset / length,
+                    y0 + (y1 - y0) * offset / length)
+                if drawing:
+                    segment.append(point)
+                    segment_set.append(segment)
+                else:
+                    segment = [point]
+                drawing = not drawing
+                remaining = dash_length
+
+            remaining = remaining - (length - offset)
+            if drawing:
+                segment.append((x1, y1))
+
+        if drawing and len(segment) > 1:
+            segment_set.append(segment)
+        return segment_set
+
+
+class PngGenerator(RasterGenerator):
+    IMAGE_FORMAT = 'PNG'
+    EXTENSION = '.png'
+
+
+class TiffGenerator(RasterGenerator):
+    IMAGE_FORMAT = 'TIFF'
+    EXTENSION = '.tif'
+    SAVE_OPTIONS = {'compression': 'tiff_deflate'}
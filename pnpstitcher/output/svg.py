@@ -1,11 +1,28 @@
 from PIL import Image
 import base64
+from pnpstitcher.image import content_hash
 from pnpstitcher.output.base import BaseGenerator
-import svgwrite
+from svgwrite.container import Style
+from svgwrite.shapes import Circle, Line, Rect
+from urllib.request import pathname2url
+import os
 import os.path
+import shutil
 
 
 class SvgGenerator(BaseGenerator):
+    DOCUMENT_HEADER = (
+        '<?xml version="1.0" encoding="utf-8" ?>\n'
+        '<svg baseProfile="full" height="{height}" version="1.1" '
+        'width="{width}" xmlns="http://www.w3.org/2000/svg" '
+        'xmlns:ev="http://www.w3.org/2001/xml-events" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink">')
+    DOCUMENT_FOOTER = '</svg>\n'
+
+    # Multiple of 3 bytes, so that each encoded block can be written out
+    # without base64 padding in between
+    BASE64_BLOCK_SIZE = 3 * 64 * 1024
+
     STYLESHEET = """
         .cutline {{
             fill: none;
@@ -38,7 +55,9 @@ class SvgGenerator(BaseGenerator):
         }}
     """
 
-    def __init__(self, filename, cutline_generator, page_config, page_dpi):
+    def __init__(
+            self, filename, cutline_generator, page_config, page_dpi,
+            first_page=1, reuse_images=False, image_mode='embed'):
         """
         Constructor.
 
@@ -46,51 +65,263 @@ class SvgGenerator(BaseGenerator):
         :param CutlineGenerator cutline_generator: The cutline generator.
         :param dict page_config: The page configuration.
         :param int page_dpi: The page dpi.
+        :param int first_page: The number of the first page rendered.
+        :param bool reuse_images: Define each distinct image once per page as
+            a symbol and place it with a reference to the symbol.
+        :param str image_mode: How the images are referred, either "embed" to
+            base64-encode them into the page, "link" to link to the source
+            files, or "copy"/"hardlink" to link to a copy of them in the
+            assets directory next to the pages.
         """
         super(SvgGenerator, self).__init__(
-            filename, cutline_generator, page_config, page_dpi)
+            filename, cutline_generator, page_config, page_dpi, first_page)
         self.base_filename, self.ext = os.path.splitext(filename)
-        self._page_number = 1
-        self._drawing = None
-        self._border_width = None
+        self._page_number = first_page
+        self.reuse_images = reuse_images
+        self.image_mode = image_mode
+        self.output_dir = os.path.dirname(os.path.abspath(filename))
+        self.asset_dir = '{}_assets'.format(
+            os.path.abspath(self.base_filename))
+        self._page_file = None
+        self._symbol_set = set()
+
+    @classmethod
+    def partial_filename(cls, filename, work_dir, first_page):
+        """
+        Get the filename of a partial output when rendering in parallel.
+
+        Every page is a file of its own, so the partial outputs are written
+        straight to the final filename.
+
+        :param str filename: The filename of the final output.
+        :param str work_dir: The directory for the intermediate files.
+        :param int first_page: The number of the first page of the partial
+            output.
+        :returns: The filename of the partial output.
+        :rtype: str
+        """
+        return filename
+
+    @classmethod
+    def partial_output_set(cls, filename, work_dir, first_page, page_count):
+        """
+        Get the files that make up a partial output.
+
+        :param str filename: The filename of the final output.
+        :param str work_dir: The directory for the intermediate files.
+        :param int first_page: The number of the first page of the partial
+            output.
+        :param int page_count: The number of pages in the partial output.
+        :returns: The filenames.
+        :rtype: list
+        """
+        return [
+            cls.page_filename(filename, page_number)
+            for page_number in range(first_page, first_page + page_count)]
+
+    @classmethod
+    def page_filename(cls, filename, page_number):
+        """
+        Get the filename of a page.
 
-    def _draw_image(self, pil_image, x_pos, y_pos, image_dimension):
+        :param str filename: The filename of the output.
+        :param int page_number: The page number.
+        :returns: The filename of the page.
+        :rtype: str
+        """
+        return '{}__page{:03d}.svg'.format(
+            os.path.splitext(filename)[0], page_number)
+
+    @classmethod
+    def merge_partials(cls, filename, partial_filename_set):
+        """
+        Merge the partial outputs rendered in parallel into the final output.
+
+        :param str filename: The filename of the final output.
+        :param list partial_filename_set: The filenames of the partial outputs
+            in page order.
+        """
+        # DOES NOTHING, the pages are already written in place.
+        return
+
+    def _write(self, element):
+        """
+        Write an element to the page.
+
+        :param svgwrite.base.BaseElement element: The element.
+        """
+        self._page_file.write(element.tostring())
+
+    def _draw_image(
+            self, pil_image, x_pos, y_pos, image_dimension, rotation=0):
         """
         Draw image onto page.
 
+        The image file is base64-encoded block by block straight into the
+        page, so only a block of it is held in memory at a time.
+
         :param Image pil_image: The image.
         :param int x_pos: The x position in inches.
         :param int y_pos: The y position in inches.
         :param list image_dimension: A 2-tuple containing the image width and
             height.
+        :param int rotation: The clockwise rotation of the image in degrees,
+            the position is the top-left corner of the rotated image.
         """
-        image = self._drawing.image(
-            'data:{format};base64,{data}'.format(
-                format=Image.MIME[pil_image.format],
-                data=base64.b64encode(
-                    open(pil_image.filename, 'rb').read()).decode('utf-8')),
-            (x_pos * self.page_dpi, y_pos * self.page_dpi),
-            (image_dimension[0] * self.page_dpi,
-                image_dimension[1] * self.page_dpi))
-        self._drawing.add(image)
+        x_pos = x_pos * self.page_dpi
+        y_pos = y_pos * self.page_dpi
+        width = image_dimension[0] * self.page_dpi
+        height = image_dimension[1] * self.page_dpi
+        if not rotation:
+            self._place_image(pil_image, x_pos, y_pos, width, height)
+            return
+
+        if rotation == 90:
+            x_pos = x_pos + height
+        elif rotation == 270:
+            y_pos = y_pos + width
+        self._page_file.write(
+            '<g transform="translate({x},{y}) rotate({rotation})">'.format(
+                x=x_pos, y=y_pos, rotation=rotation))
+        self._place_image(pil_image, 0, 0, width, height)
+        self._page_file.write('</g>')
+
+    def _place_image(self, pil_image, x_pos, y_pos, width, height):
+        """
+        Place an image onto the page, through a symbol when the images are
+        reused.
+
+        :param Image pil_image: The image.
+        :param float x_pos: The x position in page units.
+        :param float y_pos: The y position in page units.
+        :param float width: The width in page units.
+        :param float height: The height in page units.
+        """
+        if not self.reuse_images:
+            self._write_image(pil_image, x_pos, y_pos, width, height)
+            return
+
+        symbol_id = 'image-{}'.format(content_hash(pil_image.filename))
+        if symbol_id not in self._symbol_set:
+            self._page_file.write(
+                '<defs><symbol id="{}" overflow="visible">'.format(symbol_id))
+            self._write_image(pil_image, 0, 0, width, height)
+            self._page_file.write('</symbol></defs>')
+            self._symbol_set.add(symbol_id)
+
+        self._page_file.write(
+            '<use x="{x}" y="{y}" xlink:href="#{id}" />'.format(
+                x=x_pos, y=y_pos, id=symbol_id))
+
+    def _write_image(self, pil_image, x_pos, y_pos, width, height):
+        """
+        Write an image element to the page.
+
+        :param Image pil_image: The image.
+        :param float x_pos: The x position in page units.
+        :param float y_pos: The y position in page units.
+        :param float width: The width in page units.
+        :param float height: The height in page units.
+        """
+        if self.image_mode != 'embed':
+            self._page_file.write(
+                '<image height="{height}" width="{width}" x="{x}" y="{y}" '
+                'xlink:href="{href}" />'.format(
+                    x=x_pos,
+                    y=y_pos,
+                    width=width,
+                    height=height,
+                    href=self._link_image(pil_image.filename)))
+            return
+
+        self._page_file.write(
+            '<image height="{height}" width="{width}" x="{x}" y="{y}" '
+            'xlink:href="data:{format};base64,'.format(
+                x=x_pos,
+                y=y_pos,
+                width=width,
+                height=height,
+                format=Image.MIME[pil_image.format]))
+        with open(pil_image.filename, 'rb') as fp:
+            with self.stats.phase('base64'):
+                for block in iter(
+                        lambda: fp.read(self.BASE64_BLOCK_SIZE), b''):
+                    self._page_file.write(
+                        base64.b64encode(block).decode('utf-8'))
+                    self.stats.add_bytes('base64', len(block))
+        self._page_file.write('" />')
+
+    def _link_image(self, filename):
+        """
+        Get the reference to an image that is linked instead of embedded.
+
+        :param str filename: The filename of the image.
+        :returns: The URL of the image relative to the page.
+        :rtype: str
+        """
+        if self.image_mode in ('copy', 'hardlink'):
+            filename = self._export_asset(filename)
+
+        return pathname2url(
+            os.path.relpath(os.path.abspath(filename), self.output_dir))
+
+    def _export_asset(self, filename):
+        """
+        Export an image into the assets directory.
+
+        The asset is named after the content hash of the image, so identical
+        images are exported only once.
+
+        :param str filename: The filename of the image.
+        :returns: The filename of the asset.
+        :rtype: str
+        """
+        asset_fn = os.path.join(
+            self.asset_dir,
+            '{}{}'.format(
+                content_hash(filename),
+                os.path.splitext(filename)[1].lower()))
+        if os.path.exists(asset_fn):
+            return asset_fn
+
+        os.makedirs(self.asset_dir, exist_ok=True)
+        if self.image_mode == 'hardlink':
+            try:
+                os.link(filename, asset_fn)
+                return asset_fn
+            except FileExistsError:
+                return asset_fn
+            except OSError:
+                # Hard links don't work across file systems, copy it instead
+                pass
+
+        # Copy to a temporary file first, so a parallel worker exporting the
+        # same image never sees a partial file
+        temp_fn = '{}.{}.tmp'.format(asset_fn, os.getpid())
+        shutil.copyfile(filename, temp_fn)
+        os.replace(temp_fn, asset_fn)
+        return asset_fn
 
     def _initialize_page(self):
         """
         Start a fresh page.
         """
-        self._drawing = svgwrite.Drawing(
-            '{}__page{:03d}.svg'.format(self.base_filename, self._page_number),
-            size=(
-                self.page_config['width'] * self.page_dpi,
-                self.page_config['height'] * self.page_dpi),
-            profile='full')
+        self._page_file = open(
+            self.page_filename(self.filename, self._page_number),
+            'w', encoding='utf-8')
+        self._page_file.write(self.DOCUMENT_HEADER.format(
+            width=self.page_config['width'] * self.page_dpi,
+            height=self.page_config['height'] * self.page_dpi))
         self._page_number = self._page_number + 1
+        self._symbol_set.clear()
 
     def _render_page(self):
         """
         Render page.
         """
-        self._drawing.save()
+        self._page_file.write(self.DOCUMENT_FOOTER)
+        self._page_file.close()
+        self._page_file = None
 
     def _draw_cutlines(self, cutline_set, cutline_config):
         """
@@ -99,12 +330,11 @@ class SvgGenerator(BaseGenerator):
         :param list cutline_set: The list of cutlines.
         :param dict cutline_config: The cutline configuration.
         """
-        if self._border_width is None:
-            self._border_width = cutline_config['width'] * self.page_dpi
-        cutline_config['width'] = self._border_width
-
-        self._drawing.defs.add(
-            self._drawing.style(self.STYLESHEET.format(**cutline_config)))
+        style_config = dict(
+            cutline_config, width=cutline_config['width'] * self.page_dpi)
+        self._page_file.write('<defs>')
+        self._write(Style(self.STYLESHEET.format(**style_config)))
+        self._page_file.write('</defs>')
         super(SvgGenerator, self)._draw_cutlines(cutline_set, cutline_config)
 
     def _draw_cutlines_cutthrough(self, cutline_set, cutline_config):
@@ -120,7 +350,7 @@ class SvgGenerator(BaseGenerator):
             class_name = 'cutline'
 
         for line in cutline_set:
-            self._drawing.add(self._drawing.line(
+            self._write(Line(
                 (line.x0 * self.page_dpi, line.y0 * self.page_dpi),
                 (line.x1 * self.page_dpi, line.y1 * self.page_dpi),
                 class_=class_name))
@@ -137,10 +367,8 @@ class SvgGenerator(BaseGenerator):
         else:
             class_name = 'cutline'
 
-        self._drawing.defs.add(
-            self._drawing.style(self.STYLESHEET.format(**cutline_config)))
         for line in cutline_set:
-            self._drawing.add(self._drawing.rect(
+            self._write(Rect(
                 (line.x0 * self.page_dpi, line.y0 * self.page_dpi),
                 ((line.x1 - line.x0) * self.page_dpi,
                     (line.y1 - line.y0) * self.page_dpi),
@@ -158,20 +386,20 @@ class SvgGenerator(BaseGenerator):
         half_size = registration_config['size'] / 2
         size = registration_config['size']
 
-        self._drawing.add(
-            self._drawing.line(
+        self._write(
+            Line(
                 ((x_pos + half_size) * self.page_dpi, y_pos * self.page_dpi),
                 ((x_pos + half_size) * self.page_dpi,
                     (y_pos + size) * self.page_dpi),
                 class_='reg_crosshair'))
-        self._drawing.add(
-            self._drawing.line(
+        self._write(
+            Line(
                 (x_pos * self.page_dpi, (y_pos + half_size) * self.page_dpi),
                 ((x_pos + size) * self.page_dpi,
                     (y_pos + half_size) * self.page_dpi),
                 class_='reg_crosshair'))
-        self._drawing.add(
-            self._drawing.circle(
+        self._write(
+            Circle(
                 ((x_pos + half_size) * self.page_dpi,
                     (y_pos + half_size) * self.page_dpi),
                 r=size * 0.35 * self.page_dpi,
@@ -183,7 +411,7 @@ class SvgGenerator(BaseGenerator):
 
         :param dict registration_config: The registration mark configuration.
         """
-        self._drawing.add(self._drawing.rect(
+        self._write(Rect(
             (registration_config['x_pos'] * self.page_dpi,
                 registration_config['y_pos'] * self.page_dpi),
             (registration_config['size'] * self.page_dpi,
@@ -0,0 +1,277 @@
+from pdfrw.objects import PdfArray, PdfDict, PdfIndirect, PdfName
+import hashlib
+import os
+
+
+class PdfStreamWriter(object):
+    """
+    Write the pages of pdfrw documents into a PDF file as they are added.
+
+    Every object that a page refers to is written out along with the page,
+    so the output document is never built up in memory. The objects read
+    from a document are only tracked by their object number in it once
+    written, so nothing but the numbers is held on to. Streams with the same
+    dictionary and data, e.g. an image embedded in several input files, are
+    only written once.
+
+    The document is written to a temporary file that only replaces the
+    output file once it's complete.
+    """
+
+    # Page attributes that may be inherited from the parent page tree node
+    INHERITABLE_SET = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+    def __init__(self, filename):
+        """
+        Constructor.
+
+        :param str filename: The filename of the output PDF file.
+        """
+        self.filename = filename
+        self._temp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+        self._fp = open(self._temp_filename, 'wb')
+        self._fp.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._offset_set = {}
+        self._object_number_set = {}
+        self._pinned_set = []
+        self._source = None
+        self._stream_number_set = {}
+        self._in_progress_set = set()
+        self._pending_set = []
+        self._next_number = 1
+        self._pages_number = self._allocate()
+        self._kid_set = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add_page(self, page, rotate=0, source=None, index=None):
+        """
+        Add a page and write everything it refers to.
+
+        :param PdfDict page: The page.
+        :param int rotate: Degrees to rotate the page by clockwise, on top of
+            its own rotation.
+        :param str source: The document the page is read from, e.g. its
+            filename, so its objects can be tracked by their object number.
+            The objects of a page without one are kept around instead.
+        :param int index: The index of the page in the output document, so
+            the pages can be added in any order. Defaults to the number of
+            pages added so far.
+        """
+        self._source = source
+        page_copy = PdfDict()
+        for key, value in page.iteritems():
+            if key != '/Parent':
+                page_copy[key] = value
+
+        # Pull down the inherited attributes, as the page gets a new parent
+        for key in self.INHERITABLE_SET:
+            if page_copy.get(key) is None:
+                value = self._inherited(page, key)
+                if value is not None:
+                    page_copy[key] = value
+
+        if rotate:
+            page_copy[PdfName.Rotate] = (
+                int(page_copy.get(PdfName.Rotate) or 0) + rotate) % 360
+
+        # Anything referring back to the original page, e.g. an annotation,
+        # refers to the copy instead
+        number = self._allocate()
+        self._object_number_set[self._object_key(page)] = number
+        self._write_object(
+            number,
+            self._format_dict(page_copy, '/Parent {} 0 R'.format(
+                self._pages_number)))
+        if index is None:
+            index = len(self._kid_set)
+        self._kid_set.append((index, number))
+        self._flush_pending()
+
+    def close(self):
+        """
+        Write the page tree, the cross-reference table and the trailer.
+        """
+        self._write_object(
+            self._pages_number,
+            '<</Type /Pages /Count {} /Kids [{}]>>'.format(
+                len(self._kid_set),
+                ' '.join(
+                    '{} 0 R'.format(number)
+                    for index, number in sorted(self._kid_set))))
+        catalog_number = self._allocate()
+        self._write_object(
+            catalog_number,
+            '<</Type /Catalog /Pages {} 0 R>>'.format(self._pages_number))
+
+        xref_offset = self._fp.tell()
+        self._fp.write('xref\n0 {}\n0000000000 65535 f \n'.format(
+            self._next_number).encode('latin-1'))
+        for number in range(1, self._next_number):
+            self._fp.write('{:010d} 00000 n \n'.format(
+                self._offset_set[number]).encode('latin-1'))
+        self._fp.write(
+            'trailer\n<</Size {} /Root {} 0 R>>\nstartxref\n{}\n%%EOF\n'
+            .format(self._next_number, catalog_number, xref_offset)
+            .encode('latin-1'))
+        self._fp.close()
+        os.replace(self._temp_filename, self.filename)
+
+    def abort(self):
+        """
+        Throw away the document, leaving any existing output file as it is.
+        """
+        self._fp.close()
+        os.remove(self._temp_filename)
+
+    def _allocate(self):
+        number = self._next_number
+        self._next_number = self._next_number + 1
+        return number
+
+    def _inherited(self, page, key):
+        """
+        Get an attribute inherited from the ancestors of a page.
+        """
+        parent = page.get(PdfName.Parent)
+        while parent is not None:
+            value = parent.get(key)
+            if value is not None:
+                return value
+            parent = parent.get(PdfName.Parent)
+
+        return None
+
+    def _object_key(self, obj):
+        """
+        Get the key an object is tracked by.
+
+        An object read from the source document is keyed by its object
+        number in it. Any other object is keyed by its id, and kept around so
+        the id can't be reused by another object while the document is being
+        written.
+        """
+        indirect = getattr(obj, 'indirect', None)
+        if self._source is not None and isinstance(indirect, tuple):
+            # A plain tuple, as the placeholder pdfrw keys the object with
+            # refers back to its reader
+            return self._source, tuple(indirect)
+
+        self._pinned_set.append(obj)
+        return id(obj)
+
+    def _flush_pending(self):
+        """
+        Write the indirect objects that were referred to but not written yet.
+        """
+        while self._pending_set:
+            number, obj = self._pending_set.pop()
+            self._write_object(number, self._format(obj, direct=True))
+
+    def _write_object(self, number, body, stream=None):
+        self._offset_set[number] = self._fp.tell()
+        self._fp.write('{} 0 obj\n'.format(number).encode('latin-1'))
+        self._fp.write(body.encode('latin-1'))
+        if stream is not None:
+            self._fp.write(b'\nstream\n')
+            self._fp.write(stream)
+            self._fp.write(b'\nendstream')
+        self._fp.write(b'\nendobj\n')
+
+    def _reference(self, obj):
+        """
+        Get a reference to an indirect object, writing it if it's a stream
+        or queueing it to be written otherwise.
+        """
+        number = self._lookup(obj)
+        if number is not None:
+            return '{} 0 R'.format(number)
+
+        if getattr(obj, 'stream', None) is None or (
+                id(obj) in self._in_progress_set):
+            number = self._allocate()
+            self._object_number_set[self._object_key(obj)] = number
+            if id(obj) not in self._in_progress_set:
+                self._pending_set.append((number, obj))
+            return '{} 0 R'.format(number)
+
+        # Streams are written right away, so that identical streams can be
+        # matched by their content
+        self._in_progress_set.add(id(obj))
+        stream = obj.stream.encode('latin-1')
+        body = self._format_dict(
+            obj, '/Length {}'.format(len(stream)), skip_set=('/Length',))
+        self._in_progress_set.remove(id(obj))
+
+        number = self._lookup(obj)
+        if number is not None:
+            # It refers back to itself, so it got its number already
+            self._write_object(number, body, stream)
+        else:
+            digest = hashlib.sha1(
+                body.encode('latin-1') + stream).hexdigest()
+            number = self._stream_number_set.get(digest)
+            if number is None:
+                number = self._allocate()
+                self._write_object(number, body, stream)
+                self._stream_number_set[digest] = number
+            self._object_number_set[self._object_key(obj)] = number
+
+        return '{} 0 R'.format(number)
+
+    def _lookup(self, obj):
+        """
+        Get the number of an object that has a number already.
+        """
+        indirect = getattr(obj, 'indirect', None)
+        if self._source is not None and isinstance(indirect, tuple):
+            return self._object_number_set.get(
+                (self._source, tuple(indirect)))
+        return self._object_number_set.get(id(obj))
+
+    def _format(self, obj, direct=False):
+        """
+        Format an object in PDF syntax.
+
+        :param obj: The pdfrw object.
+        :param bool direct: Format the object itself even if it's indirect.
+        :returns: The formatted object.
+        :rtype: str
+        """
+        if isinstance(obj, PdfIndirect):
+            obj = obj.real_value()
+
+        if isinstance(obj, (PdfDict, PdfArray)):
+            is_indirect = getattr(obj, 'indirect', False)
+            if isinstance(obj, PdfDict) and obj.stream is not None:
+                is_indirect = True
+            if is_indirect and not direct:
+                return self._reference(obj)
+
+            if isinstance(obj, PdfDict):
+                return self._format_dict(obj)
+            return '[{}]'.format(' '.join(self._format(item) for item in obj))
+
+        if obj is None:
+            return 'null'
+        if isinstance(obj, bool):
+            return 'true' if obj else 'false'
+        if isinstance(obj, float):
+            return '{:.6f}'.format(obj).rstrip('0').rstrip('.')
+        return str(obj)
+
+    def _format_dict(self, obj, extra='', skip_set=()):
+        item_set = [
+            '{} {}'.format(key, self._format(value))
+            for key, value in obj.iteritems()
+            if key not in skip_set]
+        if extra:
+            item_set.append(extra)
+        return '<<{}>>'.format(' '.join(item_set))
@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from pnpstitcher.header import read_image_header
+from pnpstitcher.image import content_hash
+import os
+import os.path
+import threading
+
+
+class Resampler(object):
+    """
+    Downsample images to the resolution they are printed at.
+
+    The downsampled images are kept on disk, named after the content hash of
+    the source image and the output dpi, so an image is only resampled again
+    once it has changed.
+    """
+
+    # Modes that PIL resamples with a filter, anything else (e.g. palette
+    # images) would be resized with nearest neighbour
+    FILTERED_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK')
+
+    JPEG_QUALITY = 95
+
+    def __init__(self, cache_dir, source_dpi, output_dpi, jobs=None):
+        """
+        Constructor.
+
+        :param str cache_dir: The directory to keep the resampled images in.
+        :param int source_dpi: The dpi of the source images.
+        :param int output_dpi: The dpi to resample the images to.
+        :param int jobs: The number of threads to resample with, defaults to
+            the number of processors.
+        """
+        self.cache_dir = cache_dir
+        self.source_dpi = source_dpi
+        self.output_dpi = output_dpi
+        self.jobs = jobs
+
+    def resample_set(self, filename_set):
+        """
+        Resample a set of images.
+
+        Every distinct file is resampled once, in a thread pool as PIL
+        releases the GIL while resizing.
+
+        :param list filename_set: The filenames of the images.
+        :returns: The filenames of the resampled images in the same order.
+        :rtype: list
+        """
+        unique_set = list(dict.fromkeys(filename_set))
+        with ThreadPoolExecutor(self.jobs) as executor:
+            resampled_set = dict(
+                zip(unique_set, executor.map(self.resample, unique_set)))
+
+        return [resampled_set[filename] for filename in filename_set]
+
+    def resample(self, filename):
+        """
+        Resample an image.
+
+        :param str filename: The filename of the image.
+        :returns: The filename of the resampled image, or the filename of the
+            image itself if it is not above the output dpi.
+        :rtype: str
+        """
+        if self.output_dpi >= self.source_dpi:
+            return filename
+
+        header = read_image_header(filename)
+        size = (
+            max(1, round(header.width * self.output_dpi / self.source_dpi)),
+            max(1, round(header.height * self.output_dpi / self.source_dpi)))
+
+        # JPEG stays as JPEG so it could still be passed through as is
+        if header.format == 'JPEG':
+            image_format, ext = 'JPEG', '.jpg'
+        else:
+            image_format, ext = 'PNG', '.png'
+
+        resampled_fn = os.path.join(
+            self.cache_dir,
+            '{}-{}dpi{}'.format(content_hash(filename), self.output_dpi, ext))
+        if os.path.isfile(resampled_fn):
+            return resampled_fn
+
+        from PIL import Image
+
+        with Image.open(filename) as image:
+            if image.mode not in self.FILTERED_MODES:
+                image = image.convert('RGBA')
+            resampled = image.resize(size, Image.LANCZOS)
+
+        save_options = {}
+        if image_format == 'JPEG':
+            save_options['quality'] = self.JPEG_QUALITY
+
+        # Write to a temporary file first, so a concurrent run or thread never
+        # picks up a partial image
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_fn = '{}.{}.{}.tmp'.format(
+            resampled_fn, os.getpid(), threading.get_ident())
+        resampled.save(temp_fn, format=image_format, **save_options)
+        os.replace(temp_fn, resampled_fn)
+        return resampled_fn
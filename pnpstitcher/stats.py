@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+import time
+
+
+class Stats(object):
+    """
+    Timings and byte counts of the phases of a stitch job, and the timings of
+    every page.
+    """
+
+    def __init__(self):
+        self.phase_set = {}
+        self.page_set = []
+        self._page = None
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase.
+
+        :param str name: The name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def timed_iter(self, name, iterable):
+        """
+        Time how long it takes to get every item of an iterable.
+
+        :param str name: The name of the phase.
+        :param iterable: The iterable.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._record(name, time.perf_counter() - start)
+
+            yield item
+
+    def add_bytes(self, name, size):
+        """
+        Add to the byte count of a phase.
+
+        :param str name: The name of the phase.
+        :param int size: The number of bytes.
+        """
+        self._get_phase(name)['bytes'] += size
+
+    def start_page(self, page_number):
+        """
+        Start timing a page.
+
+        :param int page_number: The page number.
+        """
+        self._page = {
+            'page': page_number,
+            'start': time.perf_counter(),
+            'images': 0,
+        }
+
+    def add_page_image(self):
+        """
+        Count an image drawn onto the current page.
+        """
+        if self._page is not None:
+            self._page['images'] += 1
+
+    def end_page(self):
+        """
+        Stop timing the current page.
+        """
+        if self._page is None:
+            return
+
+        start = self._page.pop('start')
+        self._page['time'] = time.perf_counter() - start
+        self.page_set.append(self._page)
+        self._page = None
+
+    def merge(self, stats):
+        """
+        Merge the stats of another job, e.g. of a worker process.
+
+        :param dict stats: The stats, as returned by as_dict.
+        """
+        for name, phase in stats['phases'].items():
+            own_phase = self._get_phase(name)
+            for key in ('time', 'count', 'bytes'):
+                own_phase[key] += phase[key]
+
+        self.page_set.extend(stats['pages'])
+        self.page_set.sort(key=lambda page: page['page'])
+
+    def as_dict(self):
+        """
+        Get the stats as a JSON-serializable dict.
+
+        :returns: The stats.
+        :rtype: dict
+        """
+        return {
+            'phases': dict(
+                (name, dict(phase)) for name, phase in self.phase_set.items()),
+            'pages': [dict(page) for page in self.page_set],
+        }
+
+    def _get_phase(self, name):
+        phase = self.phase_set.get(name)
+        if phase is None:
+            phase = self.phase_set[name] = {
+                'time': 0.0,
+                'count': 0,
+                'bytes': 0,
+            }
+
+        return phase
+
+    def _record(self, name, duration):
+        phase = self._get_phase(name)
+        phase['time'] += duration
+        phase['count'] += 1
@@ -1,11 +1,42 @@
-import os.path
-from pint import UnitRegistry
-from tinycss2.color3 import parse_color
 from voluptuous import Invalid
+import os.path
+import re
+
+
+# The length units used by the config, in inches. Anything else is handed
+# over to Pint.
+_LENGTH_UNIT_SET = {
+    'in': 1.0,
+    'inch': 1.0,
+    'inches': 1.0,
+    'mm': 1 / 25.4,
+    'cm': 1 / 2.54,
+    'm': 1 / 0.0254,
+    'pp': 1 / 72,
+    'point': 1 / 72,
+}
+_LENGTH_RE = re.compile(
+    r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-zA-Z]+)\s*$')
+_unit_registry = None
+
+
+def _to_inches(value):
+    """
+    Convert a length to inches with Pint.
+
+    The unit registry takes a while to load, so it's only loaded the first
+    time a unit the light parser doesn't know of is used.
 
+    :param str value: The length.
+    :returns: The length in inches.
+    :rtype: float
+    """
+    global _unit_registry
+    if _unit_registry is None:
+        from pint import UnitRegistry
+        _unit_registry = UnitRegistry()
 
-ureg = UnitRegistry()
-Q_ = ureg.Quantity
+    return _unit_registry.Quantity(value).m_as('in')
 
 
 def inches(value):
@@ -16,7 +47,11 @@ def inches(value):
     :returns: The converted value in inches.
     :rtype: float
     """
-    return Q_(value).m_as('in')
+    match = _LENGTH_RE.match(value)
+    if match and match.group(2) in _LENGTH_UNIT_SET:
+        return float(match.group(1)) * _LENGTH_UNIT_SET[match.group(2)]
+
+    return _to_inches(value)
 
 
 def csscolor(value):
@@ -27,6 +62,8 @@ def csscolor(value):
     :returns: The original value.
     :rtype: str
     """
+    from tinycss2.color3 import parse_color
+
     parsed_color = parse_color(value)
     if parsed_color is None:
         raise Invalid('Invalid CSS color specified')
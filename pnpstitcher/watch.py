@@ -0,0 +1,94 @@
+import os
+import os.path
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+class FileWatcher(object):
+    """
+    Watch a set of files for changes.
+
+    The files are watched through inotify when inotify_simple is installed,
+    otherwise the files are polled for changes in their size and modification
+    time.
+    """
+
+    def __init__(self, filename_set, interval=0.5):
+        """
+        Constructor.
+
+        :param list filename_set: The filenames to be watched.
+        :param float interval: The polling interval in seconds.
+        """
+        self.filename_set = set(
+            os.path.abspath(filename) for filename in filename_set)
+        self.interval = interval
+        self._stat_set = self._stat_all()
+        self._inotify = None
+        if INotify is not None:
+            self._inotify = INotify()
+            watch_flags = (
+                flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE |
+                flags.ATTRIB)
+            # Watch the directories, editors tend to replace the file rather
+            # than writing it in place
+            for dirname in set(
+                    os.path.dirname(filename)
+                    for filename in self.filename_set):
+                self._inotify.add_watch(dirname, watch_flags)
+
+    def wait(self):
+        """
+        Block until some of the files have changed.
+
+        :returns: The filenames of the files that have changed.
+        :rtype: set
+        """
+        while True:
+            if self._inotify is not None:
+                # The events only tell that something in the directories has
+                # changed, the stats below tell which of our files did
+                self._inotify.read()
+
+                # Let the writes that come together settle down
+                time.sleep(self.interval)
+                self._inotify.read(timeout=0)
+            else:
+                time.sleep(self.interval)
+
+            stat_set = self._stat_all()
+            changed_set = set(
+                filename for filename in self.filename_set
+                if stat_set[filename] != self._stat_set[filename])
+            self._stat_set = stat_set
+            if changed_set:
+                return changed_set
+
+    def close(self):
+        """
+        Stop watching, releasing the inotify file descriptor.
+        """
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _stat_all(self):
+        """
+        Get the size and modification time of the watched files.
+
+        :returns: The stats keyed by the filename, None for a missing file.
+        :rtype: dict
+        """
+        stat_set = {}
+        for filename in self.filename_set:
+            try:
+                stat = os.stat(filename)
+                stat_set[filename] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                stat_set[filename] = None
+
+        return stat_set